@@ -0,0 +1,220 @@
+##
+#  This program benchmarks the custom GLMs against statsmodels' GLM on synthetic data. For every family,
+#  number of observations N and number of predictors p it times the load, fit and predict stages, records
+#  peak memory and iterations, and saves the results as JSON, so that two versions can be compared with --compare.
+#  Run it from the root of the repository: python3 benchmarks/glm_fit.py -o results.json
+#
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from map_dicts import model_map
+
+## Generates a synthetic dataset of a family. Xs are standard normal (plus an intercept) and betas are
+#  scaled so that the variance of eta is about 0.25 whatever p is
+#  @param model the name of the model from model_map
+#  @param n the number of observations
+#  @param p the number of predictors including the intercept
+#  @param rng numpy random generator
+#  @return tuple with x [p, N], y [1, N] and true betas
+#
+def generate(model, n, p, rng):
+    x = np.empty((p, n))
+    x[0] = 1
+    x[1:] = rng.standard_normal((p - 1, n))
+    beta = rng.standard_normal(p) * 0.5 / np.sqrt(p)
+    eta = np.matmul(x.T, beta)
+    if (model == 'normal'):
+        y = eta + rng.standard_normal(n)
+    elif (model == 'bernoulli'):
+        y = (rng.random(n) < 1 / (1 + np.exp(-eta))).astype(float)
+    elif (model == 'poisson'):
+        y = rng.poisson(np.exp(eta)).astype(float)
+    else:
+        raise Exception(f'Synthetic data is not defined for model: {model}')
+    return x, y[None, :], beta
+
+## Runs a stage several times and measures its wall time. Peak memory is measured in one more (warm) run
+#  with tracemalloc, which tracks numpy allocations, so that tracing does not slow down the timed runs
+#  @param stage a function without arguments
+#  @param repeats the number of timed runs
+#  @return tuple with a dictionary of measurements and the value returned by the last run
+#
+def measure(stage, repeats):
+    # The first run warms up lazy imports (e.g. scipy.optimize) and the OS file cache
+    stage()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = stage()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return { 'median_s': statistics.median(times), 'min_s': min(times), 'peak_mb': peak / 2**20 }, value
+
+## Benchmarks a single configuration
+#  @param model the name of the model from model_map
+#  @param n the number of observations
+#  @param p the number of predictors including the intercept
+#  @param args parsed command line arguments
+#  @param workdir a temporary folder for CSV files and the column cache
+#  @return list of records (one per library and stage)
+#
+def run_case(model, n, p, args, workdir):
+    from loaders.CSVLoader import CSVLoader
+    from loaders.CSVReader import CSVReader
+    rng = np.random.default_rng([ args.seed, n, p ])
+    x, y, beta = generate(model, n, p, rng)
+    case = { 'model': model, 'n': n, 'p': p }
+    records = []
+
+    # Loading needs at least one predictor column besides the intercept
+    if (n <= args.load_max_rows and p > 1):
+        import pandas as pd
+        x_names = [ f'x{i}' for i in range(1, p) ]
+        filename = f'{model}_{n}_{p}.csv'
+        pd.DataFrame(dict(zip(x_names + [ 'y' ], np.vstack((x[1:], y))))).to_csv(os.path.join(workdir, filename), index=False)
+        CSVReader._foldername = workdir
+        CSVLoader._cachedir = os.path.join(workdir, 'cache')
+
+        # Messages of loaders are not printed in the middle of the table
+        def load(cold):
+            if (cold):
+                shutil.rmtree(CSVLoader._cachedir, ignore_errors=True)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                return CSVReader(x_names, [ 'y' ], filename, const=True)
+        def load_pandas():
+            df = pd.read_csv(os.path.join(workdir, filename))
+            return df[x_names].to_numpy().T, df[[ 'y' ]].to_numpy().T
+
+        result, _ = measure(lambda: load(True), args.repeats)
+        records.append({ **case, 'library': 'custom', 'stage': 'load_parse', **result })
+        result, _ = measure(lambda: load(False), args.repeats)
+        records.append({ **case, 'library': 'custom', 'stage': 'load_cached', **result })
+        result, _ = measure(load_pandas, args.repeats)
+        records.append({ **case, 'library': 'statsmodels', 'stage': 'load_parse', **result })
+        os.remove(os.path.join(workdir, filename))
+
+    entry = model_map[model]
+    # Every run builds a new model, so buffers and statistics cached by a previous fit are not reused
+    def fit(method):
+        glm = entry['model'](x, y, True)
+        glm.fit(method=method)
+        return glm
+    for method in args.fit_methods:
+        result, glm = measure(lambda: fit(method), args.repeats)
+        params, diagnostics = glm.params, glm.diagnostics
+        records.append({ **case, 'library': 'custom', 'stage': 'fit', 'method': method, **result,
+                         'n_iter': diagnostics['n_iter'], 'converged': diagnostics['converged'],
+                         'max_abs_error': float(np.max(np.abs(params - beta))) })
+        result, _ = measure(lambda: glm.predict(x), args.repeats)
+        records.append({ **case, 'library': 'custom', 'stage': 'predict', 'method': method, **result })
+
+    if (not args.skip_statsmodels):
+        import statsmodels.api as sm
+        result, res = measure(lambda: sm.GLM(y.T, x.T, family=entry['reference']).fit(), args.repeats)
+        records.append({ **case, 'library': 'statsmodels', 'stage': 'fit', 'method': 'irls', **result,
+                         'n_iter': int(res.fit_history['iteration']), 'converged': bool(res.converged),
+                         'max_abs_error': float(np.max(np.abs(res.params - beta))),
+                         'max_abs_diff': float(np.max(np.abs(res.params - params))) })
+        result, _ = measure(lambda: res.predict(x.T), args.repeats)
+        records.append({ **case, 'library': 'statsmodels', 'stage': 'predict', 'method': 'irls', **result })
+    return records
+
+## Returns a key that identifies a record in two result files
+#  @param record dictionary with a result
+#  @return tuple with the configuration, library, stage and method
+#
+def record_key(record):
+    return (record['model'], record['n'], record['p'], record['library'], record['stage'], record.get('method'))
+
+## Prints the relative change of median times and peak memory against results of another version
+#  @param records current results
+#  @param path path to a JSON file saved by this program
+#
+def compare(records, path):
+    with open(path) as f:
+        baseline = { record_key(record): record for record in json.load(f)['results'] }
+    print(f'\n{"model":<10} {"N":>9} {"p":>4} {"library":<12} {"stage":<12} {"method":<10} | {"time":>8} | {"memory":>8}')
+    print('-' * 86)
+    for record in records:
+        old = baseline.get(record_key(record))
+        if (old is None):
+            continue
+        model, n, p, library, stage, method = record_key(record)
+        time_change = record['median_s'] / old['median_s'] - 1
+        memory_change = record['peak_mb'] / old['peak_mb'] - 1 if old['peak_mb'] > 0 else 0.0
+        print(f'{model:<10} {n:>9} {p:>4} {library:<12} {stage:<12} {str(method or ""):<10} | {time_change:>+8.1%} | {memory_change:>+8.1%}')
+
+## Collects versions of the environment, so that results of different machines and versions are not mixed up
+#  @return dictionary with metadata
+#
+def environment():
+    from importlib.metadata import version, PackageNotFoundError
+    versions = {}
+    for package in ('numpy', 'scipy', 'pandas', 'statsmodels'):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run([ 'git', 'rev-parse', 'HEAD' ], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return { 'python': sys.version, 'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'commit': commit, 'versions': versions }
+
+parser = argparse.ArgumentParser(description='Benchmarks the custom GLMs against statsmodels on synthetic data')
+parser.add_argument('-m', '--models', nargs='+', default=list(model_map), choices=list(model_map), help='models to benchmark')
+parser.add_argument('-n', '--sizes', nargs='+', type=float, default=[ 1e3, 1e4, 1e5 ], help='numbers of observations (the full suite uses 1e3 ... 1e7)')
+parser.add_argument('-p', '--predictors', nargs='+', type=int, default=[ 1, 10, 100 ], help='numbers of predictors including the intercept (the full suite uses 1 ... 500)')
+parser.add_argument('-fm', '--fit-methods', nargs='+', default=[ 'irls', 'BFGS' ], help='estimation methods of the custom GLMs')
+parser.add_argument('-r', '--repeats', type=int, default=3, help='the number of timed runs of every stage')
+parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the synthetic data')
+parser.add_argument('--full', action='store_true', help='run the full suite: N = 1e3 ... 1e7 and p = 1, 10, 100, 500')
+parser.add_argument('--max-gb', type=float, default=2.0, help='skip configurations whose matrix of Xs is larger than this (in GB)')
+parser.add_argument('--load-max-rows', type=float, default=1e5, help='benchmark loading from CSV only up to this number of rows')
+parser.add_argument('-sk', '--skip-statsmodels', action='store_true', help='do not benchmark statsmodels')
+parser.add_argument('-o', '--output', default=None, help='save results as JSON to this file')
+parser.add_argument('-c', '--compare', default=None, help='JSON file of a previous run to compare the results with')
+args = parser.parse_args()
+
+if (args.full):
+    args.sizes, args.predictors = [ 1e3, 1e4, 1e5, 1e6, 1e7 ], [ 1, 10, 100, 500 ]
+
+records = []
+print(f'{"model":<10} {"N":>9} {"p":>4} {"library":<12} {"stage":<12} {"method":<10} | {"median, s":>10} | {"peak, MB":>9} | {"iter":>4}')
+print('-' * 96)
+with tempfile.TemporaryDirectory() as workdir:
+    for model in args.models:
+        for n in [ int(size) for size in args.sizes ]:
+            for p in args.predictors:
+                if (n * p * 8 / 2**30 > args.max_gb):
+                    print(f'{model:<10} {n:>9} {p:>4} skipped: X takes more than {args.max_gb} GB')
+                    continue
+                for record in run_case(model, n, p, args, workdir):
+                    records.append(record)
+                    print(f'{model:<10} {n:>9} {p:>4} {record["library"]:<12} {record["stage"]:<12} {str(record.get("method", "")):<10} | '
+                          f'{record["median_s"]:>10.4f} | {record["peak_mb"]:>9.1f} | {str(record.get("n_iter", "")):>4}')
+
+if (args.compare is not None):
+    compare(records, args.compare)
+
+if (args.output is not None):
+    with open(args.output, 'w') as f:
+        json.dump({ 'environment': environment(), 'arguments': vars(args), 'results': records }, f, indent=2)
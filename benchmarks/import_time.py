@@ -0,0 +1,54 @@
+##
+#  This program measures startup time of testing_glm.py. It compares the current lazy imports with
+#  the modules that the program used to import eagerly before parsing arguments.
+#  Run it from the root of the repository: python3 benchmarks/import_time.py
+#
+import argparse
+import importlib.util
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that were imported by testing_glm.py and map_dicts.py before argparse ran
+EAGER_MODULES = [ 'numpy', 'pandas', 'scipy.stats', 'scipy.optimize', 'statsmodels.api', 'sklearn.model_selection' ]
+
+## Runs a command several times and measures its wall time
+#  @param command list with the command and its arguments
+#  @param repeats the number of measured runs
+#  @return dictionary with the median, min and max time in seconds
+#
+def measure(command, repeats):
+    # The first run warms up the OS file cache and the column cache of loaders
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return { 'median': statistics.median(times), 'min': min(times), 'max': max(times) }
+
+parser = argparse.ArgumentParser(description='Measures startup time of testing_glm.py against eager imports')
+parser.add_argument('-r', '--repeats', type=int, default=5, help='the number of measured runs of every command')
+parser.add_argument('-o', '--output', default=None, help='save results as JSON to this file')
+args = parser.parse_args()
+
+eager = [ module for module in EAGER_MODULES if importlib.util.find_spec(module.split('.')[0]) is not None ]
+commands = {
+    'eager_imports': [ sys.executable, '-c', '; '.join(f'import {module}' for module in eager) ],
+    'help': [ sys.executable, 'testing_glm.py', '-h' ],
+    # The fit cache is disabled, otherwise every run after the first one would only load the cached fit
+    'fit_no_comparison': [ sys.executable, 'testing_glm.py', '-d', 'spector', '-m', 'bernoulli', '-p', 'x1', 'x2', 'x3', '-ai', '-fm', 'irls', '-sc', '-nfc' ],
+}
+
+results = { name: measure(command, args.repeats) for name, command in commands.items() }
+baseline = results['eager_imports']['median']
+print(f'{"run":<20} | {"median, s":>10} | {"vs eager imports":>16}')
+print('-' * 52)
+for name, result in results.items():
+    print(f'{name:<20} | {result["median"]:>10.3f} | {result["median"] / baseline:>15.1%}')
+
+if (args.output is not None):
+    with open(args.output, 'w') as f:
+        json.dump({ 'python': sys.version, 'eager_modules': eager, 'results': results }, f, indent=2)
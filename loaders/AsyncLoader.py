@@ -0,0 +1,69 @@
+##
+#  This module defines the AsyncLoader class
+#
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+## This class loads several datasets concurrently with asyncio. Loaders do their blocking I/O and parsing
+#  in the constructor, so every load is offloaded to a thread pool: downloads wait on the network and
+#  pandas parses with the GIL released, so loads of different sources overlap. Datasets are returned
+#  as soon as each of them is ready, so a consumer can fit one dataset while the others are still loading
+#
+class AsyncLoader:
+    ## Constructs the AsyncLoader object
+    #  @param max_workers the number of threads that run loaders. By default it is chosen by ThreadPoolExecutor
+    #
+    def __init__(self, max_workers = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='loader')
+        # Loads of the same source share its cache entries, so they are run one after another
+        self._locks = {}
+
+    ## Loads a dataset in the thread pool. It takes the same arguments as the synchronous constructor
+    #  @param loader a CSVLoader subclass, e.g. CSVReader
+    #  @param x_names the names of the exogenous variables
+    #  @param y_names the names of the endogenous variables
+    #  @param source the filename, url or name of the dataset
+    #  @param kwargs other arguments of the loader (dtype, const, sparse, ...)
+    #  @return loaded CSVLoader object
+    #
+    async def load(self, loader, x_names, y_names, source, **kwargs):
+        lock = self._locks.setdefault((loader, source), asyncio.Lock())
+        async with lock:
+            return await asyncio.get_running_loop().run_in_executor(self._executor,
+                functools.partial(loader, x_names, y_names, source, **kwargs))
+
+    ## Loads several datasets concurrently and yields every one of them as soon as it is ready
+    #  @param datasets dictionary that maps keys to entries of dataset_map (loader, x_names, y_names, name)
+    #  @param kwargs other arguments passed to every loader (dtype, const, sparse, ...)
+    #  @return asynchronous generator of tuples (key, loader). A dataset that fails to load is yielded
+    #  with its exception instead of a loader, so the other datasets are not cancelled
+    #
+    async def load_datasets(self, datasets, **kwargs):
+        loop = asyncio.get_running_loop()
+        async def load_one(key, entry):
+            try:
+                # Resolving a lazy entry of dataset_map may import pandas, so it is not done in the event loop
+                loader = await loop.run_in_executor(self._executor, functools.partial(entry.__getitem__, 'loader'))
+                return key, await self.load(loader, entry['x_names'], entry['y_names'], entry['name'], **kwargs)
+            except Exception as e:
+                return key, e
+
+        for future in asyncio.as_completed([ load_one(key, entry) for key, entry in datasets.items() ]):
+            yield await future
+
+    ## Stops the thread pool
+    #
+    def close(self):
+        self._executor.shutdown()
+
+    ## Allows to use the loader in a with statement
+    #  @return the loader itself
+    #
+    def __enter__(self):
+        return self
+
+    ## Stops the thread pool at the end of a with statement
+    #
+    def __exit__(self, *args):
+        self.close()
@@ -2,27 +2,57 @@
 #  This module defines the CSVLoader class.
 #
 import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
+from loaders.ColumnCache import ColumnCache
+from loaders.Splitter import Splitter
 
 ## A superclass that defines main methods and properties of all CSV loaders
 #
 class CSVLoader:
+    # Streaming loaders do not keep the dataset in memory and provide it only through chunks()
+    _stream = False
+    # The folder of the on-disk column cache shared by all loaders. Set it to None to disable caching
+    _cachedir = './.cache'
+
     ## Constructs a CSVLoader object and loads the dataset
     #  @param x_names the names of the exogenous variables
     #  @param y_names the names of the endogenous variables
+    #  @param dtype a dtype of loaded matrices (e.g. 'float32', 'int32') or a dictionary with dtypes of some columns.
+    #  By default dtypes of the source are kept
+    #  @param const a boolean that tells whether a row of 1s is added to X while it is loaded
+    #  @param sparse a boolean that tells whether X is stored as a scipy.sparse matrix. It pays off when
+    #  categorical columns with many levels are expanded into one-hot rows
     #
-    def __init__(self, x_names, y_names):
-        # Creates instance variables
-        self._df = pd.DataFrame([])
+    def __init__(self, x_names, y_names, dtype = None, const = False, sparse = False):
+        # Creates instance variables. The dataframe is created only if the source has to be parsed,
+        # so pandas is not imported when all columns come from the column cache
+        self._df = None
         self._x = np.array([])
         self._y = np.array([])
         self._x_names = np.array(x_names)
         self._y_names = np.array(y_names)
+        self._dtype = dtype
+        self._const_added = const
+        self._sparse = sparse
+        # Levels of categorical columns, which are loaded as integer codes
+        self._levels = {}
+        self._feature_names = []
 
         # Loads the data inside a specific subclass
         self._load()
 
+    ## Loads a dataset without blocking the event loop. The synchronous constructor runs in the default
+    #  executor of the loop, e.g. loader = await CSVReader.load_async(x_names, y_names, filename, const=True).
+    #  AsyncLoader loads several datasets at once
+    #  @param args arguments of the constructor
+    #  @param kwargs keyword arguments of the constructor
+    #  @return loaded object
+    #
+    @classmethod
+    async def load_async(cls, *args, **kwargs):
+        import asyncio
+        import functools
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(cls, *args, **kwargs))
+
     ## Returns the matrix of exogenous variables
     #  @return matrix of Xs
     #
@@ -35,7 +65,7 @@ class CSVLoader:
     #
     @x.setter
     def x(self, new_x):
-        assert isinstance(new_x, np.ndarray), 'Expected numpy array as a new value for the matrix of Xs'
+        assert isinstance(new_x, np.ndarray) or self._sparse, 'Expected numpy array as a new value for the matrix of Xs'
         self._x = new_x
     
     ## Returns the matrix of endogenous varibles
@@ -53,6 +83,20 @@ class CSVLoader:
         assert isinstance(new_y, np.ndarray), 'Expected numpy array as a new value for the matrix of Ys'
         self._y = new_y
     
+    ## Returns the names of the rows of X. Categorical columns are expanded into one row per level, e.g. tension[M]
+    #  @return list with the names
+    #
+    @property
+    def feature_names(self):
+        return list(self._feature_names)
+
+    ## Returns the levels of categorical columns
+    #  @return dictionary that maps names of categorical columns to arrays with their levels
+    #
+    @property
+    def levels(self):
+        return dict(self._levels)
+
     ## Returns the transposed matrix of exogenous varibles
     #  @return transposed matrix of Xs
     #
@@ -67,36 +111,247 @@ class CSVLoader:
     def y_transpose(self):
         return self._y.T
     
-    ## Adds a vector of 1s to the matrix X
+    ## Adds a vector of 1s to the matrix X unless it has already been added. For streaming loaders it is added to every chunk instead.
+    #  Without an intercept the first categorical column keeps all its levels, so the row of its first level is
+    #  removed to keep the design of full rank (as if const=True had been passed to the constructor).
+    #  Passing const=True to the constructor is cheaper since the row of 1s is then filled while loading
     #
     def add_constant(self):
-        assert (len(self.x)) > 0, 'Data has not been loaded yet'
+        if (self._const_added):
+            return
+        self._const_added = True
+        if (self._stream):
+            return
+        assert self.x.shape[0] > 0, 'Data has not been loaded yet'
+        categorical = [ name for name in self._x_names if name in self._levels ]
+        rows = list(range(len(self._feature_names)))
+        if (len(categorical) > 0):
+            rows.remove(self._feature_names.index(f'{categorical[0]}[{self._levels[categorical[0]][0]}]'))
+        self._feature_names = [ 'const' ] + [ self._feature_names[row] for row in rows ]
+
+        if (self._sparse):
+            import scipy.sparse as sp
+            x = self.x if len(rows) == self.x.shape[0] else self.x.tocsr()[rows]
+            self.x = sp.vstack([ np.ones((1, self.x.shape[1]), dtype=self._const_dtype(self.x.dtype)), x ], format='csc')
+            return
 
-        # Creates a nested list of 1s with the same dimension as data
-        const_vector = np.array([ np.ones(self.x.shape[1]) ])
-        self.x = np.concatenate((const_vector, self.x))
+        # Fills a single new matrix instead of concatenating a separate vector of 1s
+        x = np.empty((len(rows) + 1, self.x.shape[1]), dtype=self._const_dtype(self.x.dtype))
+        x[0] = 1
+        x[1:] = self.x if len(rows) == self.x.shape[0] else self.x[rows]
+        self.x = x
 
+    ## The abstract method that reads the dataset from its source
+    #  @param columns the names of the columns that should be read. Other columns may be skipped
+    #  @return dataframe with the dataset
+    #
+    def _read(self, columns):
+        raise NotImplementedError
+
+    ## Identifies the data source for the column cache. Loaders that return None are not cached
+    #  @return string that identifies the source or None
+    #
+    def _source_id(self):
+        return None
+
+    ## Returns a cheap stamp that changes whenever the source may have changed (e.g. size and modification time)
+    #  @return dictionary with the stamp
+    #
+    def _source_stamp(self):
+        return {}
 
-    ## The abstract method to _load csv files 
+    ## Computes the hash of the source content, which decides whether a cache entry with an outdated stamp is stale
+    #  @return hexadecimal digest or None if it cannot be computed
+    #
+    def _content_hash(self):
+        return None
+
+    ## Loads the dataset. Columns are served from the memory-mapped column cache if it holds
+    #  a valid entry for the source. Only the remaining columns are read and they are added to the cache
     #
     def _load(self):
-        # Checks that variables with names from x_names and y_name are actually inside the dataset
-        assert np.all(np.isin(self._x_names, self._df.keys())), 'Wrong x_names provided'
-        assert np.all(np.isin(self._y_names, self._df.keys())), 'Wrong y_names provided'
+        names = list(dict.fromkeys(list(self._x_names) + list(self._y_names)))
+        source = self._source_id() if CSVLoader._cachedir is not None else None
+        cache = ColumnCache(CSVLoader._cachedir, source) if source is not None else None
+        stamp = self._source_stamp() if cache is not None else None
+        columns = {}
+        if (cache is not None and cache.lookup(stamp, self._content_hash) is not None):
+            columns = cache.columns(names)
+
+        levels = {} if cache is None else cache.levels(names)
+        missing = [ name for name in names if name not in columns ]
+        if (len(missing) > 0):
+            self._df = self._read(missing)
+            self._check_names(list(columns) + list(self._df.keys()))
+            # Categorical (non-numeric) columns are replaced with compact integer codes
+            parsed = { name: self._df[name].to_numpy() for name in self._df.columns }
+            for name, values in parsed.items():
+                if (values.dtype.kind not in 'biuf'):
+                    parsed[name], levels[name] = self._encode(values)
+            if (cache is not None):
+                cache.store(parsed, stamp, self._content_hash, levels)
+            columns.update({ name: parsed[name] for name in missing })
+        self._levels = { name: levels[name] for name in names if name in levels }
 
-        # Saves transposed data since in future we require data in the following format: [p, N]
-        self.x = self._df.loc[:, self._x_names].to_numpy().T
-        self.y = self._df.loc[:, self._y_names].to_numpy().T
+        # Matrices are filled row by row in the required format [p, N], so no transposed copies are made
+        self.x = self._design(columns, self._x_names, self._const_added)
+        self.y = self._matrix(columns, self._y_names, False)
         print(f'Successfully loaded dataset: X -> {self.x.shape} | y -> {self.y.shape}')
 
+    ## Checks that variables with names from x_names and y_name are actually inside the dataset
+    #  @param columns the names of available columns
+    #
+    def _check_names(self, columns):
+        columns = set(columns)
+        assert all(name in columns for name in self._x_names), 'Wrong x_names provided'
+        assert all(name in columns for name in self._y_names), 'Wrong y_names provided'
+
+    ## Returns a dtype that can also hold the row of 1s of an intercept
+    #  @param dtype the dtype of data
+    #  @return dtype for the matrix with an intercept
+    #
+    def _const_dtype(self, dtype):
+        return dtype if dtype.kind in 'fc' else np.result_type(dtype, np.float64)
+
+    ## Returns the dtype requested for a column
+    #  @param name the name of the column
+    #  @param default the dtype of the column in the source
+    #  @return dtype of the column after loading
+    #
+    def _column_dtype(self, name, default):
+        dtype = self._dtype.get(name) if isinstance(self._dtype, dict) else self._dtype
+        return default if dtype is None else np.dtype(dtype)
+
+    ## Builds a contiguous [p, N] matrix from columns, casting them to the requested dtype
+    #  @param columns dictionary that maps names to 1-D arrays
+    #  @param names the names of the required columns
+    #  @param const a boolean that tells whether the first row should be filled with 1s
+    #  @return matrix with the columns as rows
+    #
+    def _matrix(self, columns, names, const):
+        dtype = np.result_type(*[ self._column_dtype(name, columns[name].dtype) for name in names ])
+        if (const):
+            dtype = self._const_dtype(dtype)
+        # A single column that does not need casting is returned as a view (e.g. of the memory-mapped cache)
+        if (not const and len(names) == 1 and columns[names[0]].dtype == dtype):
+            return columns[names[0]][None, :]
+
+        matrix = np.empty((len(names) + int(const), len(columns[names[0]])), dtype=dtype)
+        if (const):
+            matrix[0] = 1
+        for i, name in enumerate(names):
+            matrix[i + int(const)] = columns[name]
+        return matrix
+
+    ## Encodes a categorical column into integer codes of the smallest sufficient dtype
+    #  @param values 1-D array with the column
+    #  @return tuple with codes and sorted levels
+    #
+    @staticmethod
+    def _encode(values):
+        levels, codes = np.unique(values.astype(str), return_inverse=True)
+        return codes.astype(np.min_scalar_type(max(len(levels) - 1, 0))), levels
+
+    ## Builds the matrix of Xs. Numeric columns become rows as in _matrix and every categorical column is
+    #  expanded into a block of one-hot rows, one per level. The first level is dropped (it is absorbed by
+    #  the intercept or, without one, by the first categorical column), so the design has full rank
+    #  @param columns dictionary that maps names to 1-D arrays (categorical ones hold codes)
+    #  @param names the names of the required columns
+    #  @param const a boolean that tells whether the first row should be filled with 1s
+    #  @return dense [p, N] matrix or, if sparse was requested, a scipy.sparse CSC matrix with observations as columns
+    #
+    def _design(self, columns, names, const):
+        self._feature_names = ([ 'const' ] if const else []) + [ str(name) for name in names ]
+        categorical = [ name for name in names if name in self._levels ]
+        if (len(categorical) == 0 and not self._sparse):
+            return self._matrix(columns, names, const)
+
+        # One-hot rows share the dtype of numeric columns (integers are promoted to float64)
+        numeric = [ self._column_dtype(name, columns[name].dtype) for name in names if name not in self._levels ]
+        dtype = self._const_dtype(np.result_type(*numeric) if len(numeric) > 0 else self._column_dtype(None, np.dtype(np.float64)))
+        n = len(columns[names[0]])
+        blocks, self._feature_names = [], []
+        if (const):
+            blocks.append((np.ones((1, n), dtype=dtype), None))
+            self._feature_names.append('const')
+        for name in names:
+            if (name not in self._levels):
+                blocks.append((self._matrix(columns, [ name ], False), None))
+                self._feature_names.append(str(name))
+                continue
+            drop = int(const or name != categorical[0])
+            levels = self._levels[name]
+            blocks.append((None, (np.asarray(columns[name]), len(levels), drop)))
+            self._feature_names.extend(f'{name}[{level}]' for level in levels[drop:])
+
+        if (self._sparse):
+            import scipy.sparse as sp
+            rows = []
+            for dense, onehot in blocks:
+                if (dense is not None):
+                    rows.append(sp.csc_matrix(dense.astype(dtype, copy=False)))
+                    continue
+                # Only observations whose level is not dropped get a non-zero, so memory grows with nnz, not N x levels
+                codes, n_levels, drop = onehot
+                obs = np.flatnonzero(codes >= drop)
+                rows.append(sp.csc_matrix((np.ones(len(obs), dtype=dtype), (codes[obs].astype(np.intp) - drop, obs)), shape=(n_levels - drop, n)))
+            return sp.vstack(rows, format='csc')
+
+        matrix = np.zeros((len(self._feature_names), n), dtype=dtype)
+        row = 0
+        for dense, onehot in blocks:
+            if (dense is not None):
+                matrix[row] = dense[0]
+                row += 1
+                continue
+            codes, n_levels, drop = onehot
+            obs = np.flatnonzero(codes >= drop)
+            matrix[row + codes[obs].astype(np.intp) - drop, obs] = 1
+            row += n_levels - drop
+        return matrix
+
+    ## Yields the dataset in blocks of observations with the same format as x and y: [p, chunksize]
+    #  @param chunksize the number of observations in each block
+    #  @return generator of tuples (x_block, y_block)
+    #
+    def chunks(self, chunksize):
+        assert chunksize > 0, 'chunksize should be positive'
+        for start in range(0, self.x.shape[1], chunksize):
+            yield self.x[:, start:start + chunksize], self.y[:, start:start + chunksize]
+
     ## Splits the dataset into testing and training parts
     #  @param test_size a fraction of data that will be used for testing. If it isn't a float in (0, 1)
     #  the whole dataset will be used for training and testing
+    #  @param random_state a seed that makes shuffling reproducible
+    #  @param shuffle a boolean that tells whether data is shuffled. Without shuffling both parts are views of the data
+    #  @param stratify a boolean that tells whether class proportions of the first row of Ys are kept in both parts
     #  @return tuple with the following data: x_train, x_test, y_train, y_test
     #
-    def test_train_split(self, test_size, random_state):
+    def test_train_split(self, test_size, random_state, shuffle = True, stratify = False):
+        assert not self._stream, 'Streaming loaders can only provide data through chunks()'
         if (isinstance(test_size, float) and 0 < test_size < 1):
-            # We use map function to transpose matrices since train_test_split can only split data in the following format: [N, p]
-            return map(lambda x: x.T, train_test_split(self.x_transpose, self.y_transpose, test_size=test_size, random_state=random_state))
+            train, test = self._splitter(shuffle, random_state, stratify).holdout(test_size)
+            return Splitter.take(self.x, train), Splitter.take(self.x, test), Splitter.take(self.y, train), Splitter.take(self.y, test)
         else:
-            return self.x, self.x, self.y, self.y
\ No newline at end of file
+            return self.x, self.x, self.y, self.y
+
+    ## Splits the dataset into K folds. Folds are gathered lazily, so only one of them is kept in memory at a time
+    #  @param n_splits the number of folds
+    #  @param random_state a seed that makes shuffling reproducible
+    #  @param shuffle a boolean that tells whether data is shuffled before splitting
+    #  @param stratify a boolean that tells whether class proportions of the first row of Ys are kept in every fold
+    #  @return generator of tuples with the following data: x_train, x_test, y_train, y_test
+    #
+    def kfold(self, n_splits, random_state = None, shuffle = True, stratify = False):
+        assert not self._stream, 'Streaming loaders can only provide data through chunks()'
+        for train, test in self._splitter(shuffle, random_state, stratify).kfold(n_splits):
+            yield Splitter.take(self.x, train), Splitter.take(self.x, test), Splitter.take(self.y, train), Splitter.take(self.y, test)
+
+    ## Creates a Splitter for the loaded observations
+    #  @param shuffle a boolean that tells whether data is shuffled
+    #  @param random_state a seed that makes shuffling reproducible
+    #  @param stratify a boolean that tells whether the first row of Ys is used as class labels
+    #  @return Splitter object
+    #
+    def _splitter(self, shuffle, random_state, stratify):
+        return Splitter(self.x.shape[1], shuffle, random_state, self.y[0] if stratify else None)
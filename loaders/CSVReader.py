@@ -1,27 +1,107 @@
 ##
 #  This module defines the CSVReader subclass 
 #
-import pandas as pd
+import os
 from loaders.CSVLoader import CSVLoader
+from loaders.ColumnCache import ColumnCache
 
-## This class allows to read CSV files
+## This class allows to read CSV files. pandas is imported only when the file has to be parsed
 #
 class CSVReader(CSVLoader):
     # This class variable is shared among all instances of CSVReader
     _foldername = './datasets'
     ## Constructs the CSVReader object 
     #  @param filename the filename of the dataset
+    #  @param stream if True, the file is not loaded into memory and can only be read in blocks through chunks()
+    #  @param dtype a dtype of loaded matrices or a dictionary with dtypes of some columns
+    #  @param const a boolean that tells whether a row of 1s is added to X while it is loaded
+    #  @param sparse a boolean that tells whether X is stored as a scipy.sparse matrix
     #
-    def __init__(self, x_names, y_names, filename):
+    def __init__(self, x_names, y_names, filename, stream = False, dtype = None, const = False, sparse = False):
         self._filename = filename
-        super().__init__(x_names, y_names)
+        self._stream = stream
+        super().__init__(x_names, y_names, dtype, const, sparse)
 
-    ## Overrides the superclass method and reads the CSV file using the folder and filenames
+    ## Returns the path to the CSV file
+    #  @return path to the file
     #
-    def _load(self):
+    @property
+    def _path(self):
+        return f'{CSVReader._foldername}/{self._filename}'
+
+    ## Overrides the superclass method and reads the requested columns of the CSV file using the folder and filenames.
+    #  Other columns are skipped by the parser
+    #  @param columns the names of the columns that should be read
+    #  @return dataframe with the columns
+    #
+    def _read(self, columns):
+        import pandas as pd
         try:
-            self._df = pd.read_csv(f'{CSVReader._foldername}/{self._filename}')
+            header = set(self._header())
+            return pd.read_csv(self._path, usecols=[ name for name in columns if name in header ])
         except Exception as e:
             raise Exception(f'Failed to read the CSV file due to the following error: {e}')
-        else:
+
+    ## Reads only the names of the columns of the CSV file
+    #  @return list with the names
+    #
+    def _header(self):
+        import pandas as pd
+        return list(pd.read_csv(self._path, nrows=0).columns)
+
+    ## The absolute path to the file identifies the source in the column cache
+    #  @return string that identifies the source
+    #
+    def _source_id(self):
+        return f'file:{os.path.abspath(self._path)}'
+
+    ## The size and modification time of the file are used as a cheap stamp
+    #  @return dictionary with the stamp
+    #
+    def _source_stamp(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return {}
+        return { 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns }
+
+    ## Hashes the content of the file
+    #  @return hexadecimal digest or None if the file cannot be read
+    #
+    def _content_hash(self):
+        try:
+            return ColumnCache.file_hash(self._path)
+        except OSError:
+            return None
+
+    ## Overrides the superclass method. A streaming reader only reads the header to validate names
+    #
+    def _load(self):
+        if (not self._stream):
             super()._load()
+            return
+        try:
+            self._check_names(self._header())
+        except AssertionError:
+            raise
+        except Exception as e:
+            raise Exception(f'Failed to read the CSV file due to the following error: {e}')
+        print(f'Successfully opened dataset for streaming: {self._path}')
+
+    ## Yields the dataset in blocks of observations: [p, chunksize]. A streaming reader parses the file
+    #  chunk by chunk, so only one block of the requested columns is kept in memory at a time
+    #  @param chunksize the number of observations in each block
+    #  @return generator of tuples (x_block, y_block)
+    #
+    def chunks(self, chunksize):
+        if (not self._stream):
+            yield from super().chunks(chunksize)
+            return
+        import pandas as pd
+        names = list(dict.fromkeys(list(self._x_names) + list(self._y_names)))
+        for df in pd.read_csv(self._path, usecols=names, chunksize=chunksize):
+            columns = { name: df[name].to_numpy() for name in names }
+            # Levels of a categorical column are not known until the whole file has been read
+            if (any(columns[name].dtype.kind not in 'biuf' for name in self._x_names)):
+                raise Exception('Categorical columns cannot be streamed. Load the dataset with stream=False')
+            yield self._matrix(columns, self._x_names, self._const_added), self._matrix(columns, self._y_names, False)
@@ -1,25 +1,79 @@
 ##
-#  This module defines the CSVScraper subclass 
+#  This module defines the CSVScraper subclass
 #
-import pandas as pd
+import tempfile
 from loaders.CSVLoader import CSVLoader
+from loaders.HTTPCache import HTTPCache
 
-## This class allows to download CSVs from the Internet
+## This class allows to download CSVs from the Internet. Downloads are kept in a local HTTP cache
+#  and revalidated with conditional requests, so an unchanged file is not downloaded again.
+#  pandas is imported only when the file has to be parsed
 #
 class CSVScraper(CSVLoader):
-    ## Constructs the CSVScraper object 
+    # These class variables are shared among all instances of CSVScraper
+    _timeout = 10
+    _retries = 2
+    # In offline mode datasets are served only from the HTTP cache
+    _offline = False
+
+    ## Constructs the CSVScraper object
     #  @param url the url where the desired csv file is located
+    #  @param dtype a dtype of loaded matrices or a dictionary with dtypes of some columns
+    #  @param const a boolean that tells whether a row of 1s is added to X while it is loaded
+    #  @param sparse a boolean that tells whether X is stored as a scipy.sparse matrix
+    #  @param offline if True, no requests are made and the cached copy is used. By default CSVScraper._offline is used
     #
-    def __init__(self, x_names, y_names, url):
+    def __init__(self, x_names, y_names, url, dtype = None, const = False, sparse = False, offline = None):
         self._url = url
-        super().__init__(x_names, y_names)
+        self._offline = CSVScraper._offline if offline is None else offline
+        self._download = None
+        super().__init__(x_names, y_names, dtype, const, sparse)
+
+    ## Returns a local copy of the CSV, revalidating the cached one at most once per load
+    #  @return tuple with the path to the local copy and its metadata
+    #
+    def _fetch(self):
+        if (self._download is None):
+            cache = HTTPCache(CSVLoader._cachedir, CSVScraper._timeout, CSVScraper._retries)
+            self._download = cache.fetch(self._url, self._offline)
+        return self._download
 
     ## Overrides the superclass method and downloades a CSV using the url provided to constructor
+    #  @param columns the names of the columns that should be parsed
+    #  @return dataframe with the columns
+    #
+    def _read(self, columns):
+        import pandas as pd
+        if (CSVLoader._cachedir is None and self._offline):
+            raise Exception(f'{self._url} cannot be loaded in offline mode, since the cache is disabled (CSVLoader._cachedir is None)')
+        try:
+            if (CSVLoader._cachedir is not None):
+                return pd.read_csv(self._fetch()[0], usecols=lambda name: name in columns)
+            # Without a cache folder the file is downloaded into a temporary one, so the timeout and retries still apply
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path, _ = HTTPCache(tmpdir, CSVScraper._timeout, CSVScraper._retries).fetch(self._url)
+                return pd.read_csv(path, usecols=lambda name: name in columns)
+        except Exception as e:
+            raise Exception(f'Failed to download a CSV file due to the following error: {e}')
+
+    ## The url identifies the source in the column cache
+    #  @return string that identifies the source
+    #
+    def _source_id(self):
+        return f'url:{self._url}'
+
+    ## The hash of the revalidated download is used as a stamp, so the column cache is reused
+    #  as long as the server reports that the file has not changed
+    #  @return dictionary with the stamp
     #
-    def _load(self):
+    def _source_stamp(self):
         try:
-            self._df = pd.read_csv(self._url)
+            return { 'sha256': self._fetch()[1]['sha256'] }
         except Exception as e:
             raise Exception(f'Failed to download a CSV file due to the following error: {e}')
-        else:
-            super()._load()
+
+    ## Returns the hash of the downloaded file
+    #  @return hexadecimal digest
+    #
+    def _content_hash(self):
+        return self._fetch()[1]['sha256']
@@ -1,28 +1,45 @@
 ##
 #  This module defines the CSVReader subclass 
 #
-import pandas as pd
-import statsmodels.api as sm
+from importlib.metadata import version
 from loaders.CSVLoader import CSVLoader
 
 ## This class allows to read CSV files
 #
 class CSVStatsLoader(CSVLoader):
     ## Constructs the CSVReader object 
-    #  @param filename the filename of the dataset
+    #  @param name the name of the dataset
+    #  @param dtype a dtype of loaded matrices or a dictionary with dtypes of some columns
+    #  @param const a boolean that tells whether a row of 1s is added to X while it is loaded
+    #  @param sparse a boolean that tells whether X is stored as a scipy.sparse matrix
     #
-    def __init__(self, x_names, y_names, name):
+    def __init__(self, x_names, y_names, name, dtype = None, const = False, sparse = False):
         self._name = name
-        super().__init__(x_names, y_names)
+        super().__init__(x_names, y_names, dtype, const, sparse)
 
     ## Overrides the superclass method and loads a sm's in-built dataset using the name provided in constructor
+    #  @param columns the names of the columns that should be kept
+    #  @return dataframe with the columns
     #
-    def _load(self):
+    def _read(self, columns):
+        # statsmodels is imported only on a cache miss since it is slow to import
+        import statsmodels.api as sm
         try:
-            if (self._name == 'duncan'): self._df = sm.datasets.get_rdataset('Duncan', 'carData').data
-            elif (self._name == 'spector'): self._df = sm.datasets.spector.load_pandas().data
+            if (self._name == 'duncan'): df = sm.datasets.get_rdataset('Duncan', 'carData').data
+            elif (self._name == 'spector'): df = sm.datasets.spector.load_pandas().data
             else: raise Exception('Dataset with the given name has not been found')
+            return df.loc[:, [ name for name in columns if name in df.columns ]]
         except Exception as e:
             raise Exception(f'Failed to read the CSV file due to the following error: {e}')
-        else:
-            super()._load()
+
+    ## The name of the dataset identifies the source in the column cache
+    #  @return string that identifies the source
+    #
+    def _source_id(self):
+        return f'statsmodels:{self._name}'
+
+    ## Datasets are shipped with statsmodels, so they can change only together with its version
+    #  @return dictionary with the stamp
+    #
+    def _source_stamp(self):
+        return { 'statsmodels': version('statsmodels') }
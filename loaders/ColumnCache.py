@@ -0,0 +1,134 @@
+##
+#  This module defines the ColumnCache class.
+#
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+## An on-disk columnar cache of parsed datasets. Every numeric column is saved as a separate .npy file,
+#  so later loads open memory-mapped views of only the requested columns instead of parsing the source.
+#  Categorical columns are saved as integer codes together with their levels
+#
+class ColumnCache:
+    # Version of the cache layout. Entries written with another version are rebuilt
+    _version = 2
+
+    ## Constructs a ColumnCache object for a single data source
+    #  @param cachedir the folder where all cached datasets are stored
+    #  @param source a string that identifies the data source (e.g. a path or a url)
+    #
+    def __init__(self, cachedir, source):
+        self._source = source
+        self._dir = os.path.join(cachedir, 'columns', hashlib.sha256(source.encode()).hexdigest()[:32])
+        self._meta_path = os.path.join(self._dir, 'meta.json')
+        self._meta = None
+
+    ## Returns the metadata of a valid cache entry or None. A cheap stamp (e.g. file size and modification
+    #  time) is compared first. If it differs, the content hash decides whether the entry is stale
+    #  @param stamp a dictionary that changes whenever the source may have changed
+    #  @param content_hash a function without arguments returning the hash of the source or None
+    #  @return dictionary with metadata or None if there is no valid entry
+    #
+    def lookup(self, stamp, content_hash):
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (meta.get('version') != ColumnCache._version or meta.get('source') != self._source):
+            self.invalidate()
+            return None
+        if (meta['stamp'] != stamp):
+            digest = content_hash()
+            if (digest is None or digest != meta['hash']):
+                self.invalidate()
+                return None
+            # The source was touched but its content is the same, so only the stamp is refreshed
+            meta['stamp'] = stamp
+            self._write_meta(meta)
+        self._meta = meta
+        return meta
+
+    ## Opens memory-mapped views of the requested columns that are cached
+    #  @param names the names of the columns
+    #  @return dictionary that maps names of cached columns to read-only arrays
+    #
+    def columns(self, names):
+        if (self._meta is None):
+            return {}
+        return { name: np.load(os.path.join(self._dir, self._meta['columns'][name]['file']), mmap_mode='r')
+                 for name in names if name in self._meta['columns'] }
+
+    ## Returns levels of the requested categorical columns that are cached
+    #  @param names the names of the columns
+    #  @return dictionary that maps names of cached categorical columns to arrays with their levels
+    #
+    def levels(self, names):
+        if (self._meta is None):
+            return {}
+        return { name: np.array(self._meta['columns'][name]['levels']) for name in names
+                 if name in self._meta['columns'] and 'levels' in self._meta['columns'][name] }
+
+    ## Saves numeric columns and records their names and dtypes. Columns are added to
+    #  a valid entry, otherwise a new entry is created
+    #  @param columns dictionary that maps names to 1-D arrays (e.g. all parsed columns)
+    #  @param stamp a dictionary that changes whenever the source may have changed
+    #  @param content_hash a function without arguments returning the hash of the source or None
+    #  @param levels dictionary with levels of the columns that hold categorical codes
+    #
+    def store(self, columns, stamp, content_hash, levels = None):
+        levels = levels or {}
+        if (self._meta is None):
+            self.invalidate()
+            meta = {
+                'version': ColumnCache._version,
+                'source': self._source,
+                'stamp': stamp,
+                'hash': content_hash(),
+                'nrows': len(next(iter(columns.values()), [])),
+                'columns': {},
+            }
+        else:
+            meta = self._meta
+        os.makedirs(self._dir, exist_ok=True)
+        for name, values in columns.items():
+            # Object columns would require pickling and cannot be memory-mapped, so they are not cached
+            if (values.dtype.kind not in 'biuf' or str(name) in meta['columns'] or len(values) != meta['nrows']):
+                continue
+            filename = f'c{len(meta["columns"])}.npy'
+            np.save(os.path.join(self._dir, filename), np.ascontiguousarray(values))
+            meta['columns'][str(name)] = { 'file': filename, 'dtype': values.dtype.str }
+            if (name in levels):
+                meta['columns'][str(name)]['levels'] = [ str(level) for level in levels[name] ]
+        self._write_meta(meta)
+
+    ## Removes the cache entry of this source
+    #
+    def invalidate(self):
+        self._meta = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    ## Writes metadata atomically, so that an interrupted write never leaves a corrupted entry
+    #  @param meta dictionary with metadata
+    #
+    def _write_meta(self, meta):
+        tmp_path = f'{self._meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+        self._meta = meta
+
+    ## Computes the SHA-256 hash of a file without reading it into memory at once
+    #  @param path path to the file
+    #  @return hexadecimal digest
+    #
+    @staticmethod
+    def file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
@@ -0,0 +1,127 @@
+##
+#  This module defines the HTTPCache class.
+#
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+## A local cache of downloaded files. Cached files are revalidated with conditional GET requests
+#  (If-None-Match / If-Modified-Since), so an unchanged file is never transferred again
+#
+class HTTPCache:
+    # Size of blocks used to stream responses to disk
+    _blocksize = 1 << 20
+
+    ## Constructs the HTTPCache object
+    #  @param cachedir the folder where downloaded files are stored
+    #  @param timeout timeout of a single request in seconds
+    #  @param retries the number of additional attempts after a failed request
+    #  @param backoff delay before the first retry in seconds. It doubles after every retry
+    #
+    def __init__(self, cachedir, timeout = 10, retries = 2, backoff = 0.5):
+        self._dir = os.path.join(cachedir, 'http')
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+
+    ## Returns paths to the cached body and metadata of the url
+    #  @param url the url of the file
+    #  @return tuple with both paths
+    #
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return os.path.join(self._dir, f'{key}.body'), os.path.join(self._dir, f'{key}.json')
+
+    ## Reads metadata of a cached file
+    #  @param url the url of the file
+    #  @return dictionary with metadata or None if the url is not cached
+    #
+    def meta(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(body_path) and meta.get('url') == url else None
+
+    ## Returns a local copy of the file, downloading it only if it has changed since the last request
+    #  @param url the url of the file
+    #  @param offline if True, the cached copy is returned without any requests
+    #  @return tuple with the path to the local copy and its metadata
+    #
+    def fetch(self, url, offline = False):
+        body_path, _ = self._paths(url)
+        meta = self.meta(url)
+        if (offline):
+            if (meta is None):
+                raise Exception(f'{url} is not cached and cannot be loaded in offline mode')
+            return body_path, meta
+
+        headers = {}
+        if (meta is not None and meta.get('etag')): headers['If-None-Match'] = meta['etag']
+        if (meta is not None and meta.get('last_modified')): headers['If-Modified-Since'] = meta['last_modified']
+
+        delay = self._backoff
+        for attempt in range(self._retries + 1):
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self._timeout) as response:
+                    return body_path, self._store(url, response)
+            except urllib.error.HTTPError as e:
+                if (e.code == 304 and meta is not None):
+                    return body_path, meta
+                # Client errors will not be fixed by retrying
+                if (e.code < 500):
+                    raise
+                error = e
+            except (urllib.error.URLError, OSError) as e:
+                error = e
+            if (attempt == self._retries):
+                if (meta is None):
+                    raise error
+                # The server is unreachable or keeps failing, so the last downloaded copy is served
+                print(f'Failed to revalidate {url}. Using the cached copy')
+                return body_path, meta
+            time.sleep(delay)
+            delay *= 2
+
+    ## Streams a response to disk, hashing it on the way, and saves its validators
+    #  @param url the url of the file
+    #  @param response an open HTTP response with status 200
+    #  @return dictionary with metadata
+    #
+    def _store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(self._dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = f'{body_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: response.read(HTTPCache._blocksize), b''):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        os.replace(tmp_path, body_path)
+
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': digest.hexdigest(),
+            'size': size,
+        }
+        with open(f'{meta_path}.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{meta_path}.tmp', meta_path)
+        return meta
+
+    ## Removes the cached copy of the url
+    #  @param url the url of the file
+    #
+    def invalidate(self, url):
+        for path in self._paths(url):
+            if (os.path.exists(path)):
+                os.remove(path)
@@ -0,0 +1,101 @@
+##
+#  This module defines the Splitter class.
+#
+import math
+import numpy as np
+
+## This class produces indices of observations for holdout and K-fold splits. Observations are permuted
+#  only once, and contiguous blocks are returned as slices so that data can be split without copies
+#
+class Splitter:
+    ## Constructs the Splitter object
+    #  @param n the number of observations
+    #  @param shuffle a boolean that tells whether observations are shuffled before splitting
+    #  @param random_state a seed that makes shuffling reproducible
+    #  @param labels optional vector of class labels used for stratified splits
+    #
+    def __init__(self, n, shuffle = True, random_state = None, labels = None):
+        assert n > 1, 'At least 2 observations are required to split data'
+        assert labels is None or len(labels) == n, 'Labels should be given for every observation'
+        self._n = n
+        self._shuffle = shuffle
+        self._random_state = random_state
+        self._labels = None if labels is None else np.asarray(labels)
+
+    ## Returns the order of observations. The same legacy generator as in scikit-learn is used,
+    #  so unstratified holdout splits are identical to train_test_split with the same random_state
+    #  @return permutation of observations or None if data is not shuffled
+    #
+    def _permutation(self):
+        if (not self._shuffle):
+            return None
+        return np.random.RandomState(self._random_state).permutation(self._n)
+
+    ## Orders observations so that every class forms a block and classes are shuffled inside blocks
+    #  @return tuple with the ordered indices and the sizes of blocks
+    #
+    def _by_class(self):
+        perm = self._permutation()
+        order = np.arange(self._n) if perm is None else perm
+        order = order[np.argsort(self._labels[order], kind='stable')]
+        _, counts = np.unique(self._labels, return_counts=True)
+        return order, counts
+
+    ## Splits observations into a training and a testing part
+    #  @param test_size a fraction of observations used for testing, between 0 and 1
+    #  @return tuple with indices (a slice or an array) of training and testing observations
+    #
+    def holdout(self, test_size):
+        assert 0 < test_size < 1, f'test_size should be between 0 and 1. Got: {test_size}'
+        n_test = math.ceil(test_size * self._n)
+        assert 0 < n_test < self._n, 'test_size leaves one of the parts empty'
+
+        if (self._labels is not None):
+            # Every class contributes to the test part in proportion to its size
+            order, counts = self._by_class()
+            starts = np.concatenate(([ 0 ], np.cumsum(counts)[:-1]))
+            class_test = np.round(counts * n_test / self._n).astype(int)
+            test_mask = np.zeros(self._n, dtype=bool)
+            for start, size in zip(starts, class_test):
+                test_mask[order[start:start + size]] = True
+            return np.flatnonzero(~test_mask), np.flatnonzero(test_mask)
+
+        perm = self._permutation()
+        if (perm is None):
+            return slice(0, self._n - n_test), slice(self._n - n_test, self._n)
+        return perm[n_test:], perm[:n_test]
+
+    ## Splits observations into K folds. Every observation is used for testing exactly once
+    #  @param n_splits the number of folds
+    #  @return generator of tuples with indices of training and testing observations
+    #
+    def kfold(self, n_splits):
+        assert 1 < n_splits <= self._n, f'n_splits should be between 2 and the number of observations. Got: {n_splits}'
+        if (self._labels is not None):
+            # Observations ordered by class are dealt to folds in turn, so each fold keeps class proportions
+            order, _ = self._by_class()
+            fold_of = np.empty(self._n, dtype=int)
+            fold_of[order] = np.arange(self._n) % n_splits
+            for fold in range(n_splits):
+                yield np.flatnonzero(fold_of != fold), np.flatnonzero(fold_of == fold)
+            return
+
+        perm = self._permutation()
+        bounds = np.cumsum([ 0 ] + [ len(part) for part in np.array_split(np.arange(self._n), n_splits) ])
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if (perm is None):
+                yield np.concatenate((np.arange(start), np.arange(stop, self._n))), slice(start, stop)
+            else:
+                # Sorted indices make gathering columns of [p, N] matrices cache friendly
+                yield np.sort(np.concatenate((perm[:start], perm[stop:]))), np.sort(perm[start:stop])
+
+    ## Gathers observations (columns) of a [p, N] matrix. Slices return views, index arrays a single copy
+    #  @param data matrix (a numpy array or a scipy.sparse CSC matrix) with observations as columns
+    #  @param index a slice or an array of indices
+    #  @return matrix with the selected observations
+    #
+    @staticmethod
+    def take(data, index):
+        if (isinstance(index, slice) or not isinstance(data, np.ndarray)):
+            return data[:, index]
+        return np.take(data, index, axis=1)
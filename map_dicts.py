@@ -1,45 +1,82 @@
-import statsmodels.api as sm
+import importlib
 
-from loaders.CSVScraper import CSVScraper
-from loaders.CSVReader import CSVReader
-from loaders.CSVStatsLoader import CSVStatsLoader
+## A reference to an object inside a module that is imported only when the object is needed
+#
+class _Lazy:
+    ## Constructs the reference
+    #  @param module the name of the module
+    #  @param attr a dotted path to the object inside the module
+    #  @param call a boolean that tells whether the object should be called (e.g. to create a family instance)
+    #
+    def __init__(self, module, attr, call = False):
+        self._module = module
+        self._attr = attr
+        self._call = call
 
-from models.GLMNormal import GLMNormal
-from models.GLMBernoulli import GLMBernoulli
-from models.GLMPoisson import GLMPoisson
+    ## Imports the module and returns the object
+    #  @return referenced object
+    #
+    def resolve(self):
+        obj = importlib.import_module(self._module)
+        for name in self._attr.split('.'):
+            obj = getattr(obj, name)
+        return obj() if self._call else obj
+
+## A dictionary that resolves lazy references when they are accessed for the first time.
+#  Thus only the loader, model and reference family that are actually selected get imported
+#
+class _LazyEntry(dict):
+    ## Returns a value, importing it first if it is a lazy reference
+    #  @param key the key of the value
+    #  @return resolved value
+    #
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if (isinstance(value, _Lazy)):
+            value = value.resolve()
+            self[key] = value
+        return value
+
+    ## Returns a resolved value or the default if the key is missing
+    #  @param key the key of the value
+    #  @param default value returned for missing keys
+    #  @return resolved value or default
+    #
+    def get(self, key, default = None):
+        return self[key] if key in self else default
 
 dataset_map = {
-    'duncan': {
+    'duncan': _LazyEntry({
         'name': 'duncan',
-        'loader': CSVStatsLoader,
+        'loader': _Lazy('loaders.CSVStatsLoader', 'CSVStatsLoader'),
         'x_names': [ 'education', 'prestige' ],
         'y_names': [ 'income' ]
-    },
-    'spector': {
+    }),
+    'spector': _LazyEntry({
         'name': 'spector',
-        'loader': CSVStatsLoader,
+        'loader': _Lazy('loaders.CSVStatsLoader', 'CSVStatsLoader'),
         'x_names': [ 'GPA', 'TUCE', 'PSI' ],
         'y_names': [ 'GRADE' ]
-    },
-    'warpbreaks': {
+    }),
+    'warpbreaks': _LazyEntry({
         'name': 'https://raw.githubusercontent.com/BI-DS/GRA-4152/refs/heads/master/warpbreaks.csv',
-        'loader': CSVScraper,
+        'loader': _Lazy('loaders.CSVScraper', 'CSVScraper'),
         'x_names': [ 'wool', 'tension' ],
         'y_names': [ 'breaks' ]
-    },
+    }),
 }
 
 model_map = {
-    'normal': {
-        'model': GLMNormal,
-        'reference': sm.families.Gaussian()
-    },
-    'bernoulli': {
-        'model': GLMBernoulli,
-        'reference': sm.families.Binomial()
-    },
-    'poisson': {
-        'model': GLMPoisson,
-        'reference': sm.families.Poisson()
-    },
-}
\ No newline at end of file
+    'normal': _LazyEntry({
+        'model': _Lazy('models.GLMNormal', 'GLMNormal'),
+        'reference': _Lazy('statsmodels.api', 'families.Gaussian', call=True)
+    }),
+    'bernoulli': _LazyEntry({
+        'model': _Lazy('models.GLMBernoulli', 'GLMBernoulli'),
+        'reference': _Lazy('statsmodels.api', 'families.Binomial', call=True)
+    }),
+    'poisson': _LazyEntry({
+        'model': _Lazy('models.GLMPoisson', 'GLMPoisson'),
+        'reference': _Lazy('statsmodels.api', 'families.Poisson', call=True)
+    }),
+}
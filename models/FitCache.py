@@ -0,0 +1,146 @@
+##
+#  This module defines the FitCache class
+#
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from models.GLMBase import GLMBase
+
+## An on-disk cache of fit results addressed by their content: the key is a hash of the training (and testing)
+#  arrays and of the fit configuration, so a repeated run with the same data and settings skips fitting.
+#  Every entry holds the fitted model as a compact artifact (see GLMBase.save) and optional output of
+#  a reference model. The least recently used entries are evicted when the cache grows above its size limit
+#
+class FitCache:
+    # The folder of the cache. Set it to None to disable caching
+    _cachedir = './.cache'
+    # Version of cache entries. It is a part of every key, so entries of other versions are never hit
+    _version = 1
+
+    ## Constructs the FitCache object
+    #  @param cachedir the folder where all cached data is stored. Fit results are kept in its subfolder fits
+    #  @param max_bytes the size limit of the cache in bytes
+    #
+    def __init__(self, cachedir = None, max_bytes = 256 * 2**20):
+        self._dir = os.path.join(FitCache._cachedir if cachedir is None else cachedir, 'fits')
+        self._max_bytes = max_bytes
+
+    ## Computes the key of a fit from its data and configuration
+    #  @param arrays list of arrays the fit depends on (numpy arrays or scipy.sparse matrices)
+    #  @param config JSON-serializable dictionary with the configuration (model, intercept, method, optimizer options, ...)
+    #  @return hexadecimal key
+    #
+    @staticmethod
+    def key(arrays, config):
+        from importlib.metadata import version, PackageNotFoundError
+        versions = {}
+        for package in ('numpy', 'scipy', 'statsmodels'):
+            try:
+                versions[package] = version(package)
+            except PackageNotFoundError:
+                versions[package] = None
+        digest = hashlib.sha256(json.dumps({ 'version': FitCache._version, 'versions': versions, 'config': config }, sort_keys=True).encode())
+        for array in arrays:
+            # The format, shape and dtype are hashed too, so equal bytes of different arrays do not collide.
+            # The Python class is not: the column cache serves the same data as ndarray or memmap
+            if (hasattr(array, 'indptr')):
+                parts = [ array.data, array.indices, array.indptr ]
+                # CSR and CSC buffers of a matrix and its transpose are equal, so the sparse layout is hashed
+                tag = f'sparse-{array.format}'
+            else:
+                parts = [ array ]
+                tag = 'dense'
+            digest.update(f'{tag}{array.shape}'.encode())
+            for part in parts:
+                part = np.ascontiguousarray(part)
+                digest.update(f'{part.dtype.str}{part.shape}'.encode())
+                digest.update(part.data)
+        return digest.hexdigest()
+
+    ## Returns paths to the files of an entry
+    #  @param key the key of the entry
+    #  @return tuple with paths to the model artifact and to the reference output
+    #
+    def _paths(self, key):
+        return os.path.join(self._dir, f'{key}.glm'), os.path.join(self._dir, f'{key}.npz')
+
+    ## Returns a cached fit and marks it as recently used
+    #  @param key the key of the entry
+    #  @return tuple with the fitted model and a dictionary with the reference output (or None), or None on a miss
+    #
+    def get(self, key):
+        model_path, reference_path = self._paths(key)
+        try:
+            model = GLMBase.load(model_path)
+        except Exception:
+            # A missing, truncated or outdated entry is a miss
+            return None
+        reference = None
+        if (os.path.exists(reference_path)):
+            with np.load(reference_path) as data:
+                reference = { name: data[name] for name in data.files }
+            reference['summary'] = str(reference['summary']) if 'summary' in reference else None
+        for path in (model_path, reference_path):
+            if (os.path.exists(path)):
+                os.utime(path)
+        return model, reference
+
+    ## Stores a fit and evicts the least recently used entries if the cache is too large
+    #  @param key the key of the entry
+    #  @param model fitted GLM
+    #  @param reference optional dictionary with arrays of a reference model (e.g. params, bse, predictions) and its summary text
+    #  @param metadata optional JSON-serializable dictionary saved with the model
+    #
+    def put(self, key, model, reference = None, metadata = None):
+        os.makedirs(self._dir, exist_ok=True)
+        model_path, reference_path = self._paths(key)
+        if (reference is not None):
+            self._write(reference_path, lambda f: np.savez(f, **{ name: np.asarray(value) for name, value in reference.items() if value is not None }))
+        elif (os.path.exists(reference_path)):
+            os.remove(reference_path)
+        # The model is written last, so an entry is complete as soon as its model exists
+        self._write(model_path, lambda f: f.write(model.to_bytes(metadata)))
+        self._evict()
+
+    ## Removes an entry
+    #  @param key the key of the entry
+    #
+    def remove(self, key):
+        for path in self._paths(key):
+            if (os.path.exists(path)):
+                os.remove(path)
+
+    ## Writes a file atomically, so that an interrupted write never leaves a corrupted entry
+    #  @param path path to the file
+    #  @param write a function that writes the content into an open binary file
+    #
+    def _write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    ## Evicts the least recently used entries until the cache fits into its size limit
+    #
+    def _evict(self):
+        entries = {}
+        for entry in os.scandir(self._dir):
+            key, ext = os.path.splitext(entry.name)
+            if (ext in ('.glm', '.npz')):
+                stat = entry.stat()
+                size, used = entries.get(key, (0, 0))
+                entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if (total <= self._max_bytes):
+                break
+            self.remove(key)
+            total -= size
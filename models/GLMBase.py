@@ -1,16 +1,50 @@
 ##
 #  This module defines a superclass GLMBase for all GLMs
 #  
+import importlib
+import json
+import struct
+import sys
+import time
 import numpy as np
-from scipy.optimize import minimize
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+from scipy.special import ndtr, ndtri
 
+## Checks whether a matrix is a scipy.sparse matrix. scipy.sparse is slow to import,
+#  so it is not imported here: if nobody has imported it, X cannot be sparse
+#  @param x matrix with Xs
+#  @return True for scipy.sparse matrices
+#
+def _issparse(x):
+    sparse = sys.modules.get('scipy.sparse')
+    return sparse is not None and sparse.issparse(x)
 
 ## A superclass that defines main methods and properties of all GLMs
 #
 class GLMBase:
-    ## Constructs the GLM superclass
-    #  @param x a matrix of exogenous variables with the next format: [p, N]
-    #  @param y a matrix of endogenous variables with the next format: [p, N]
+    # Whether IRLS weights are constant (e.g. Normal), which allows to factorize the design only once
+    _fixed_weights = False
+    # Methods of scipy's minimize which make use of the Hessian
+    _hess_methods = ('Newton-CG', 'dogleg', 'trust-ncg', 'trust-krylov', 'trust-exact', 'trust-constr')
+    # Tolerances of the methods of scipy's minimize that are used unless tol is given. Default ones of Newton-CG and
+    # trust-ncg stop far from the optimum of loglikelihood sums (e.g. 4e-3 away from statsmodels' betas on spector)
+    _default_options = { 'Newton-CG': { 'xtol': 1e-10 }, 'trust-ncg': { 'gtol': 1e-10 } }
+    # Methods that are timed by instrument() and the telemetry category every one of them is counted in
+    _timed_methods = { '_get_eta': 'get_eta', '_rev_link': 'rev_link', '_llik': 'llik', '_kernel': 'llik',
+                       '_neg_llik_grad': 'objective', '_fisher': 'hessian' }
+    # The name of the family's link function, which is recorded in saved models
+    _link_name = None
+    # Families that saved models may name and their modules. Nothing else is imported while loading an artifact
+    _families = { 'GLMNormal': 'models.GLMNormal', 'GLMBernoulli': 'models.GLMBernoulli', 'GLMPoisson': 'models.GLMPoisson' }
+    # Whether the dispersion is estimated (Pearson chi2 / residual df, e.g. Normal) or fixed to 1
+    _estimate_scale = False
+    # Magic bytes and version of the saved model format. Artifacts of another version are rejected
+    _magic = b'GLMB'
+    _format_version = 1
+
+    ## Constructs the GLM superclass. x and y may be None for models that are fit with fit_stream() or partial_fit()
+    #  @param x a matrix of exogenous variables with the next format: [p, N]. It may be a scipy.sparse matrix (preferably CSC)
+    #  @param y a matrix of endogenous variables with the next format: [k, N], where k is the number of responses
     #  @param const a boolean that tells whether the interception point is used
     #
     def __init__(self, x, y, const):
@@ -19,15 +53,33 @@ class GLMBase:
         self._params = np.array([])
         self._fit = False
         self._const = const
+        self._diagnostics = {}
+        # Preallocated arrays reused by likelihood kernels and y-only constants cached per fit
+        self._buffers = {}
+        self._y_cache = None
+        # Accumulated Fisher information of observations seen by partial_fit()
+        self._seen_hess = None
+        self._n_seen = 0
+        # Telemetry collected by instrumented fits. None means that instrumentation is disabled
+        self._telemetry = None
+        self._callback = None
+        # User metadata restored from a saved model
+        self._metadata = {}
+        # Inference results (Fisher information, deviance, covariance, ...) computed on demand and cached until the next fit
+        self._inference = {}
+        # Worker processes with shards of the data kept between sharded fits
+        self._shard_pool = None
 
         self._check_args()
 
     ## Checks that all inputs are correct
     #
     def _check_args(self):
-        assert isinstance(self._x, np.ndarray) and isinstance(self._y, np.ndarray), 'Input data should be numpy arrays'
-        assert self._x.shape[1] == self._y.shape[1], 'Matrices have different numbers of observations'
         assert isinstance(self._const, bool), 'const should be boolean'
+        if (self._x is None and self._y is None):
+            return
+        assert (isinstance(self._x, np.ndarray) or _issparse(self._x)) and isinstance(self._y, np.ndarray), 'Input data should be numpy arrays'
+        assert self._x.shape[1] == self._y.shape[1], 'Matrices have different numbers of observations'
 
     ## Checks that the model has been fit
     #
@@ -37,26 +89,146 @@ class GLMBase:
     ## Calculates eta by multiplying parameters and endogenous variables
     #  @param params matrix with betas
     #  @param x matrix with Xs
+    #  @param out optional preallocated array to store the result in
     #  @return matrix multiplication product
     #
-    def _get_eta(self, params, x):
-        return np.matmul(x.T, params)
+    def _get_eta(self, params, x, out = None):
+        if (_issparse(x)):
+            eta = x.T @ params
+            if (out is None):
+                return eta
+            out[...] = eta
+            return out
+        return np.matmul(x.T, params, out=out)
+
+    ## Computes the weighted Gram matrix XWX'. Only non-zeros of X are visited if it is sparse
+    #  @param x matrix with Xs
+    #  @param w [N] vector or [N, k] matrix with weights. If None, X is not weighted
+    #  @return [p, p] matrix for a vector of weights (or None) and a [k, p, p] array for a matrix of weights
+    #
+    def _gram(self, x, w = None):
+        if (_issparse(x)):
+            if (w is None):
+                return (x @ x.T).toarray()
+            if (w.ndim == 1):
+                return (x.multiply(w[None, :]) @ x.T).toarray()
+            return np.stack([ (x.multiply(w[None, :, j]) @ x.T).toarray() for j in range(w.shape[1]) ])
+        if (w is None):
+            return np.matmul(x, x.T)
+        if (w.ndim == 1):
+            return np.matmul(x * w, x.T)
+        return np.einsum('pn,nk,qn->kpq', x, w, x, optimize=True)
+
+    ## Returns a preallocated array with the given name, reallocating it only if the shape changes
+    #  @param name name of the buffer
+    #  @param shape required shape of the buffer
+    #  @return array that may be overwritten by the caller
+    #
+    def _buffer(self, name, shape):
+        buffer = self._buffers.get(name)
+        if (buffer is None or buffer.shape != shape):
+            buffer = self._buffers[name] = np.empty(shape)
+        return buffer
+
+    ## Reshapes Ys and computes the terms of loglikelihood that depend only on Ys. The result is cached,
+    #  so these terms are evaluated once per fit rather than on every likelihood evaluation
+    #  @param y matrix with Ys
+    #  @return tuple with reshaped Ys and the constant term (one per response)
+    #
+    def _prepare(self, y):
+        if (self._y_cache is None or self._y_cache[0] is not y):
+            # A single response becomes a [N] vector, several responses become a [N, k] matrix aligned with eta
+            y_flat = np.asarray(np.ravel(y) if np.ndim(y) == 1 or y.shape[0] == 1 else y.T, dtype=float, order='C')
+            self._y_cache = (y, y_flat, self._y_const(y_flat))
+        return self._y_cache[1:]
+
+    ## Defines the part of a model's loglikelihood that depends only on Ys
+    #  @param y vector of Ys
+    #  @return constant term of loglikelihood
+    #
+    def _y_const(self, y):
+        return 0.0
     
     ## Defines a reverse model's link function
     #  @param eta matrix multiplication product for betas and Xs
+    #  @param out optional preallocated array to store mus in (it may be eta itself)
     #  @return matrix of mus calculated by this function
     #
-    def _rev_link(self, eta):
+    def _rev_link(self, eta, out = None):
+        raise NotImplementedError
+
+    ## Defines a model's link function (inverse of _rev_link)
+    #  @param mu matrix of mus
+    #  @return matrix of etas calculated by this function
+    #
+    def _link(self, mu):
+        raise NotImplementedError
+
+    ## Provides starting values of mu for IRLS. By default Ys are shrunk towards their mean
+    #  so that the link function is defined for every observation
+    #  @param y matrix with Ys used for training
+    #  @return matrix of initial mus
+    #
+    def _init_mu(self, y):
+        return (y + np.mean(y, axis=0)) / 2
+
+    ## Defines a model's variance function. For the canonical links used by all families
+    #  it is also the derivative of mu with respect to eta
+    #  @param mu matrix of mus
+    #  @return matrix of variances evaluated at mu
+    #
+    def _variance(self, mu):
+        raise NotImplementedError
+
+    ## Evaluates a model's loglikelihood directly from eta in a numerically stable way
+    #  @param eta vector with etas
+    #  @param y vector with Ys
+    #  @param const constant term returned by _y_const
+    #  @return loglikelihood
+    #
+    def _llik(self, eta, y, const):
         raise NotImplementedError
 
-    ## Evaluates negative loglikelihood for the given model.
+    ## Defines a model's unit deviance: twice the loglikelihood of the saturated model minus that of the fitted one
+    #  @param y matrix with Ys
+    #  @param mu matrix of mus
+    #  @return matrix with the deviance of every observation
+    #
+    def _unit_deviance(self, y, mu):
+        raise NotImplementedError
+
+    ## Evaluates loglikelihood and mus in a single pass. Families may override it to share work between both
+    #  @param eta vector with etas
+    #  @param y vector with Ys
+    #  @param const constant term returned by _y_const
+    #  @return tuple with loglikelihood and vector of mus (which may be a reused buffer)
+    #
+    def _kernel(self, eta, y, const):
+        return self._llik(eta, y, const), self._rev_link(eta)
+
+    ## Evaluates negative loglikelihood and its gradient sharing a single pass over the data.
+    #  Since all families use canonical links the gradient is equal to -X(y - mu)
     #  @param params matrix with betas
     #  @param x matrix with Xs used for training
     #  @param y matrix with Ys used for training
-    #  @return negative loglikelihood for given inputs
+    #  @return tuple with negative loglikelihood and its gradient
     #
-    def _neg_llik(self, params, x, y):
-        raise NotImplementedError
+    def _neg_llik_grad(self, params, x, y):
+        y, const = self._prepare(y)
+        eta = self._get_eta(params, x, out=self._buffer('eta', y.shape))
+        llik, mu = self._kernel(eta, y, const)
+        resid = np.subtract(y, mu, out=self._buffer('resid', y.shape))
+        return -llik, -(x @ resid)
+
+    ## Evaluates the Fisher information (Hessian of negative loglikelihood) in closed form: XWX'
+    #  @param params matrix with betas
+    #  @param x matrix with Xs used for training
+    #  @param y matrix with Ys used for training
+    #  @return [p, p] matrix with the Fisher information
+    #
+    def _fisher(self, params, x, y):
+        mu = self._rev_link(self._get_eta(params, x))
+        return self._gram(x, self._variance(mu))
     
     ## Returns estimated betas to the user
     #
@@ -64,23 +236,1020 @@ class GLMBase:
     def params(self):
         return self._params
     
-    ## Evaluates negative loglikelihood for the given model.
-    #  @param init_param initial value for betas. Default value is 0.1
+    ## Returns convergence diagnostics of the last fit (method, converged, n_iter, n_fev, message, neg_llik)
+    #  @return dictionary with diagnostics
+    #
+    @property
+    def diagnostics(self):
+        self._check_fit()
+        return self._diagnostics
+
+    ## Enables or disables instrumentation of fits. An instrumented model wraps its likelihood methods with
+    #  timers and records every iteration of fit(). A model that is not instrumented runs the plain methods,
+    #  so instrumentation costs nothing while it is disabled
+    #  @param enabled a boolean that tells whether fits are instrumented
+    #  @param callback optional function called after every iteration with the record of the iteration
+    #  (a dictionary with iter, neg_llik, grad_norm and elapsed)
+    #
+    def instrument(self, enabled = True, callback = None):
+        for method in GLMBase._timed_methods:
+            self.__dict__.pop(method, None)
+        self._telemetry = None
+        self._callback = None
+        if (not enabled):
+            return
+        self._callback = callback
+        self._reset_telemetry()
+        for method, category in GLMBase._timed_methods.items():
+            setattr(self, method, self._timed(category, getattr(type(self), method).__get__(self)))
+
+    ## Returns telemetry of the last instrumented fit: the number of calls and the time spent (excluding
+    #  nested timed calls) in every category (objective, get_eta, rev_link, llik, hessian), the history
+    #  of iterations and the total time of the fit
+    #  @return dictionary with telemetry or None if the model is not instrumented
+    #
+    @property
+    def telemetry(self):
+        if (self._telemetry is None):
+            return None
+        return { key: value for key, value in self._telemetry.items() if not key.startswith('_') }
+
+    ## Clears counters, timers and the history before a new fit
+    #
+    def _reset_telemetry(self):
+        categories = dict.fromkeys(GLMBase._timed_methods.values())
+        self._telemetry = {
+            'calls': { category: 0 for category in categories },
+            'time': { category: 0.0 for category in categories },
+            'history': [],
+            'fit_time': 0.0,
+            '_stack': [],
+            '_start': time.perf_counter(),
+        }
+
+    ## Wraps a method with a timer. Time of nested calls of other categories is subtracted, so every
+    #  category reports only its own work. Nested calls of the same category are neither counted nor timed twice
+    #  @param category the telemetry category
+    #  @param method the bound method
+    #  @return wrapped method
+    #
+    def _timed(self, category, method):
+        def timed(*args, **kwargs):
+            stack = self._telemetry['_stack']
+            if (any(frame[0] == category for frame in stack)):
+                return method(*args, **kwargs)
+            stack.append([ category, 0.0 ])
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _, nested = stack.pop()
+                self._telemetry['calls'][category] += 1
+                self._telemetry['time'][category] += elapsed - nested
+                if (len(stack) > 0):
+                    stack[-1][1] += elapsed
+        return timed
+
+    ## Records an iteration of an instrumented fit and passes it to the callback
+    #  @param iteration the number of the iteration
+    #  @param neg_llik negative loglikelihood (one per response)
+    #  @param grad_norm norm of the gradient of negative loglikelihood (one per response)
+    #
+    def _record(self, iteration, neg_llik, grad_norm):
+        neg_llik, grad_norm = np.atleast_1d(neg_llik), np.atleast_1d(grad_norm)
+        record = {
+            'iter': int(iteration),
+            'neg_llik': float(neg_llik[0]) if neg_llik.size == 1 else neg_llik.tolist(),
+            'grad_norm': float(grad_norm[0]) if grad_norm.size == 1 else grad_norm.tolist(),
+            'elapsed': time.perf_counter() - self._telemetry['_start'],
+        }
+        self._telemetry['history'].append(record)
+        if (self._callback is not None):
+            self._callback(record)
+
+    ## Estimates betas either by minimizing negative loglikelihood with the analytic gradient and Hessian
+    #  or by iteratively reweighted least squares (IRLS). If Ys contain k > 1 responses, a [p, k] matrix
+    #  of betas is estimated: IRLS solves all responses at once, minimize fits them one by one
+    #  @param init_param initial value for betas (a number, a [p] vector or a [p, k] matrix).
+    #  By default minimize starts from 0.1 and IRLS starts from Ys
+    #  @param method 'irls' or an optimizer used by scipy's minimize (e.g. BFGS, Newton-CG, trust-ncg). Default value is BFGS
+    #  @param tol tolerance for termination. By default 1e-8 is used for IRLS, GLMBase._default_options for
+    #  Newton-CG and trust-ncg and scipy's own tolerance for other methods
+    #  @param max_iter maximum number of iterations. By default scipy's own limit is used and 100 for IRLS
+    #  @param solver 'qr' or 'cholesky' - a least squares solver used by IRLS
+    #  @param workers the number of processes that evaluate loglikelihood on shards of the data (see ShardPool).
+    #  By default the fit runs in the current process. Only a single response and dense Xs can be sharded.
+    #  The pool is kept by the model and reused by later fits with the same data and workers until close()
     #  @return estimated betas
     #
-    def fit(self, init_param = 0.1):
-        init_params = np.repeat(init_param, self._x.shape[0])
-        results = minimize(self._neg_llik, init_params, args=(self._x, self._y))
-        self._params = results['x']
+    def fit(self, init_param = None, method = 'BFGS', tol = None, max_iter = None, solver = 'qr', workers = None):
+        if (self._telemetry is not None):
+            self._reset_telemetry()
+        self._inference = {}
+        self._seen_hess, self._n_seen = None, 0
+        if (workers is not None and workers > 1):
+            # Imported on first use, so that serial fits do not load multiprocessing
+            from models.ShardPool import ShardPool
+            if (self._shard_pool is None or not self._shard_pool.matches(type(self), self._x, self._y, self._const, workers)):
+                self.close()
+                self._shard_pool = ShardPool(type(self), self._x, self._y, self._const, workers)
+            self._params = self._fit_sharded(self._shard_pool, init_param, method, tol, max_iter)
+        elif (method == 'irls'):
+            init_params = None if init_param is None else self._init_params(init_param)
+            self._params = self._fit_irls(init_params, 1e-8 if tol is None else tol, 100 if max_iter is None else max_iter, solver)
+        else:
+            init_params = self._init_params(0.1 if init_param is None else init_param)
+            responses = [ self._y ] if self.n_responses == 1 else [ self._y[j:j + 1] for j in range(self.n_responses) ]
+            results = [ self._fit_minimize(init_params if init_params.ndim == 1 else init_params[:, j], y, method, tol, max_iter)
+                        for j, y in enumerate(responses) ]
+            self._params = results[0]['x'] if len(results) == 1 else np.stack([ res['x'] for res in results ], axis=1)
+            self._diagnostics = self._collect_diagnostics(method,
+                [ bool(res['success']) for res in results ],
+                [ int(res.get('nit', 0)) for res in results ],
+                [ float(res['fun']) for res in results ],
+                [ str(res['message']) for res in results ],
+                [ int(res.get('nfev', 0)) for res in results ])
+        if (self._telemetry is not None):
+            self._telemetry['fit_time'] = time.perf_counter() - self._telemetry['_start']
         self._fit = True
-        return results['x']
-    
-    ## Prints results of model estimation
+        return self._params
+
+    ## Returns the number of responses (rows of Ys) the model is fit to
+    #  @return number of responses
+    #
+    @property
+    def n_responses(self):
+        if (self._y is None):
+            return 1 if np.ndim(self._params) <= 1 else self._params.shape[1]
+        return 1 if np.ndim(self._y) == 1 else self._y.shape[0]
+
+    ## Converts a user-supplied starting value into an array of betas
+    #  @param init_param a number, a [p] vector or a [p, k] matrix
+    #  @return array with initial betas
+    #
+    def _init_params(self, init_param):
+        init_params = np.asarray(init_param, dtype=float)
+        return np.repeat(init_params, self._x.shape[0]) if init_params.ndim == 0 else init_params
+
+    ## Fits a single response with scipy's minimize
+    #  @param init_params [p] vector of initial betas
+    #  @param y [1, N] matrix with Ys
+    #  @param method an optimizer used by scipy's minimize
+    #  @param tol tolerance for termination
+    #  @param max_iter maximum number of iterations
+    #  @return scipy's optimization result
+    #
+    def _fit_minimize(self, init_params, y, method, tol, max_iter):
+        # scipy.optimize is slow to import and is not needed by IRLS, so it is imported on first use
+        from scipy.optimize import minimize
+        # The Hessian is passed only to the methods that are able to use it, otherwise scipy raises a warning
+        hess = self._fisher if method in GLMBase._hess_methods else None
+        options = self._minimize_options(method, tol, max_iter)
+        fun, callback = self._neg_llik_grad, None
+        if (self._telemetry is not None):
+            # The last evaluation is kept, since optimizers usually accept the point they have evaluated last
+            last, iterations = {}, iter(range(1, sys.maxsize))
+            def fun(params, x, y):
+                last['params'], last['value'] = params.copy(), self._neg_llik_grad(params, x, y)
+                return last['value']
+            def callback(params, *args):
+                neg_llik, grad = last['value'] if np.array_equal(params, last['params']) else self._neg_llik_grad(params, self._x, y)
+                self._record(next(iterations), neg_llik, np.linalg.norm(grad))
+        res = minimize(fun, init_params, args=(self._x, y), method=method, jac=True, hess=hess, tol=tol, options=options, callback=callback)
+        return self._accept_precision_stop(res, method, tol, lambda params: self._neg_llik_grad(params, self._x, y),
+                                           lambda params: self._fisher(params, self._x, y))
+
+    ## Builds options of scipy's minimize
+    #  @param method optimization method
+    #  @param tol tolerance given by the user (None for the defaults of the method)
+    #  @param max_iter maximum number of iterations (None for the default of scipy)
+    #  @return dictionary with options
+    #
+    def _minimize_options(self, method, tol, max_iter):
+        options = dict(GLMBase._default_options.get(method, {})) if tol is None else {}
+        if (max_iter is not None):
+            options['maxiter'] = max_iter
+        return options
+
+    ## Tight default tolerances may lie below the precision of the objective, so Newton-CG and trust-ncg often stop
+    #  with a loss of precision right at the optimum. Such a result is accepted if a Newton step from it cannot
+    #  decrease the objective by more than its rounding error
+    #  @param res result of minimize
+    #  @param method optimization method
+    #  @param tol tolerance given by the user
+    #  @param neg_llik_grad function of betas returning negative loglikelihood and its gradient
+    #  @param fisher function of betas returning the Fisher information
+    #  @return the result, marked as successful if it has converged
+    #
+    def _accept_precision_stop(self, res, method, tol, neg_llik_grad, fisher):
+        if (res['success'] or tol is not None or method not in GLMBase._default_options or res['status'] != 2):
+            return res
+        neg_llik, grad = neg_llik_grad(res['x'])
+        decrement = grad @ np.linalg.solve(fisher(res['x']), grad)
+        if (decrement <= 100 * np.finfo(float).eps * np.abs(neg_llik)):
+            res['success'], res['message'] = True, 'Optimization terminated at the precision of the objective'
+        return res
+
+    ## Builds the diagnostics dictionary. Values are scalars for a single response and arrays otherwise
+    #  @param method the name of the estimation method
+    #  @param converged convergence flag of every response
+    #  @param n_iter number of iterations of every response
+    #  @param neg_llik final negative loglikelihood of every response
+    #  @param messages final messages of the solver
+    #  @param n_fev number of evaluations of loglikelihood for every response
+    #  @return dictionary with diagnostics
+    #
+    def _collect_diagnostics(self, method, converged, n_iter, neg_llik, messages, n_fev):
+        if (len(converged) == 1):
+            return { 'method': method, 'converged': bool(converged[0]), 'n_iter': int(n_iter[0]), 'n_fev': int(n_fev[0]),
+                     'message': messages[0], 'neg_llik': float(neg_llik[0]) }
+        failed = len(converged) - int(np.sum(converged))
+        return {
+            'method': method,
+            'converged': np.array(converged, dtype=bool),
+            'n_iter': np.array(n_iter, dtype=int),
+            'n_fev': np.array(n_fev, dtype=int),
+            'message': 'Optimization terminated successfully' if failed == 0 else f'{failed} of {len(converged)} responses did not converge',
+            'neg_llik': np.array(neg_llik, dtype=float),
+        }
+
+    ## Factorizes the design once when IRLS weights do not depend on mu, so that the factorization
+    #  is shared by every response and every iteration
+    #  @param x matrix with Xs
+    #  @param solver 'qr' or 'cholesky'
+    #  @return the factorization or None if weights depend on mu
+    #
+    def _factorize(self, x, solver):
+        if (not self._fixed_weights):
+            return None
+        if (solver == 'qr'):
+            return np.linalg.qr(x.T)
+        return cho_factor(self._gram(x))
+
+    ## Solves weighted least squares problems min ||sqrt(w) (z - X'b)|| for every response
+    #  @param x matrix with Xs
+    #  @param z [N, k] matrix with working responses
+    #  @param w [N, k] matrix with working weights
+    #  @param solver 'qr' or 'cholesky'
+    #  @param factor a shared factorization returned by _factorize or None
+    #  @return [p, k] matrix with betas
+    #
+    def _wls(self, x, z, w, solver, factor = None):
+        if (solver not in ('qr', 'cholesky')):
+            raise Exception(f'Unknown solver: {solver}. Expected qr or cholesky')
+        if (factor is not None):
+            if (solver == 'qr'):
+                return solve_triangular(factor[1], np.matmul(factor[0].T, z))
+            return cho_solve(factor, x @ z)
+
+        params = np.empty((x.shape[0], z.shape[1]))
+        if (solver == 'qr'):
+            sqrt_w = np.sqrt(w)
+            for j in range(z.shape[1]):
+                q, r = np.linalg.qr(x.T * sqrt_w[:, j, None])
+                params[:, j] = solve_triangular(r, np.matmul(q.T, sqrt_w[:, j] * z[:, j]))
+        else:
+            # All XWX' matrices are built in one vectorized pass, only the small [p, p] solves are looped
+            hess = self._gram(x, w)
+            rhs = x @ (w * z)
+            for j in range(z.shape[1]):
+                params[:, j] = cho_solve(cho_factor(hess[j]), rhs[:, j])
+        return params
+
+    ## Estimates betas by iteratively reweighted least squares. Only family hooks (_rev_link, _link,
+    #  _variance, _init_mu) are used, so any new family gets this solver for free. All responses are
+    #  updated together and every response stops iterating as soon as it converges
+    #  @param init_params initial betas ([p] or [p, k]). If None, IRLS starts from mus given by _init_mu
+    #  @param tol relative change of negative loglikelihood that stops iterations
+    #  @param max_iter maximum number of iterations
+    #  @param solver 'qr' or 'cholesky'. Sparse Xs are always solved with normal equations (cholesky)
+    #  @return estimated betas
+    #
+    def _fit_irls(self, init_params, tol, max_iter, solver):
+        x = self._x
+        if (_issparse(x)):
+            # QR would densify X, while XWX' is a small dense [p, p] matrix built from the non-zeros only
+            solver = 'cholesky'
+        y, const = self._prepare(self._y)
+        single = y.ndim == 1
+        y = y.reshape(y.shape[0], -1)
+        k = y.shape[1]
+        const = np.broadcast_to(const, (k,))
+
+        params = np.zeros((x.shape[0], k))
+        obj = np.full(k, np.inf)
+        if (init_params is None):
+            mu = self._init_mu(y)
+            eta = self._link(mu)
+            prev = None
+        else:
+            params[:] = init_params.reshape(x.shape[0], -1)
+            eta = self._get_eta(params, x)
+            mu = self._rev_link(eta)
+            obj = -self._llik(eta, y, const)
+            prev = params.copy()
+
+        converged = np.zeros(k, dtype=bool)
+        n_iter = np.zeros(k, dtype=int)
+        n_fev = np.full(k, 0 if init_params is None else 1)
+        grad_norm = np.zeros(k)
+        # Indices of responses that are still iterating; arrays below hold only these responses
+        active = np.arange(k)
+        y_a, const_a, obj_a = y, const, obj
+        factor = self._factorize(x, solver)
+        for it in range(1, max_iter + 1):
+            # For canonical links dmu/deta equals the variance, so it serves both as a weight and a derivative
+            w = np.maximum(self._variance(mu), np.finfo(float).eps)
+            z = eta + (y_a - mu) / w
+            new_params = self._wls(x, z, w, solver, factor)
+            new_eta = self._get_eta(new_params, x)
+            new_obj = -self._llik(new_eta, y_a, const_a)
+            n_fev[active] += 1
+
+            # Step halving guards against overshooting from poor starting values. Increases below
+            # the tolerance are rounding noise near the optimum and do not trigger it
+            slack = tol * (np.abs(obj_a) + tol)
+            bad = ~(new_obj <= obj_a + slack)
+            halvings = 0
+            while (prev is not None and np.any(bad) and halvings < 30):
+                new_params[:, bad] = (prev[:, bad] + new_params[:, bad]) / 2
+                new_eta[:, bad] = self._get_eta(new_params[:, bad], x)
+                new_obj[bad] = -self._llik(new_eta[:, bad], y_a[:, bad], const_a[bad])
+                n_fev[active[bad]] += 1
+                bad = ~(new_obj <= obj_a + slack)
+                halvings += 1
+
+            done = np.abs(obj_a - new_obj) <= tol * (np.abs(new_obj) + tol)
+            params[:, active] = new_params
+            obj[active] = new_obj
+            n_iter[active] = it
+            converged[active[done]] = True
+            if (self._telemetry is not None):
+                grad_norm[active] = np.linalg.norm(x @ (y_a - type(self)._rev_link(self, new_eta)), axis=0)
+                self._record(it, obj, grad_norm)
+
+            keep = ~done
+            if (not np.any(keep)):
+                break
+            active, y_a, const_a = active[keep], y_a[:, keep], const_a[keep]
+            prev, eta, obj_a = new_params[:, keep], new_eta[:, keep], new_obj[keep]
+            mu = self._rev_link(eta)
+
+        self._diagnostics = self._collect_diagnostics('irls', converged, n_iter, obj,
+            [ 'Optimization terminated successfully' if conv else 'Maximum number of iterations has been exceeded' for conv in converged ], n_fev)
+        return params[:, 0] if single else params
+
+    ## Stops the worker processes kept by sharded fits and frees their shared memory. The model can still be
+    #  used: the next fit with workers starts a new pool
+    #
+    def close(self):
+        if (self._shard_pool is not None):
+            self._shard_pool.close()
+            self._shard_pool = None
+
+    ## Returns the state for pickling. Worker processes are not copied
+    #  @return dictionary with attributes
+    #
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shard_pool'] = None
+        return state
+
+    ## Estimates a single response with likelihood evaluations spread over a ShardPool. Every step sends
+    #  betas to the workers, which return partial sums of their shards. IRLS solves the summed normal
+    #  equations with the same step halving and stopping rule as _fit_irls, other methods use scipy's minimize
+    #  @param pool ShardPool built on Xs and Ys of this model
+    #  @param init_param initial value for betas or None
+    #  @param method 'irls' or an optimizer used by scipy's minimize
+    #  @param tol tolerance for termination
+    #  @param max_iter maximum number of iterations
+    #  @return estimated betas
+    #
+    def _fit_sharded(self, pool, init_param, method, tol, max_iter):
+        if (method != 'irls'):
+            from scipy.optimize import minimize
+            init_params = self._init_params(0.1 if init_param is None else init_param)
+            hess = pool.fisher if method in GLMBase._hess_methods else None
+            options = self._minimize_options(method, tol, max_iter)
+            last, iterations = {}, iter(range(1, sys.maxsize))
+            def fun(params):
+                last['params'], last['value'] = params.copy(), pool.neg_llik_grad(params)
+                return last['value']
+            def callback(params, *args):
+                neg_llik, grad = last['value'] if np.array_equal(params, last['params']) else pool.neg_llik_grad(params)
+                self._record(next(iterations), neg_llik, np.linalg.norm(grad))
+            res = minimize(fun, init_params, method=method, jac=True, hess=hess, tol=tol, options=options,
+                           callback=None if self._telemetry is None else callback)
+            res = self._accept_precision_stop(res, method, tol, pool.neg_llik_grad, pool.fisher)
+            self._diagnostics = self._collect_diagnostics(method, [ bool(res['success']) ], [ int(res.get('nit', 0)) ],
+                [ float(res['fun']) ], [ str(res['message']) ], [ int(res.get('nfev', 0)) ])
+            # The workers are stopped after the fit, so the Fisher information at the estimate is kept now
+            self._inference['fisher'] = pool.fisher(res['x'])
+            return res['x']
+
+        tol = 1e-8 if tol is None else tol
+        max_iter = 100 if max_iter is None else max_iter
+        params = None if init_param is None else np.ravel(self._init_params(init_param))
+        obj, hess, rhs = pool.irls_stats(params)
+        n_fev = 0 if params is None else 1
+        converged = False
+        for it in range(1, max_iter + 1):
+            new_params = cho_solve(cho_factor(hess), rhs)
+            new_obj, new_hess, new_rhs = pool.irls_stats(new_params)
+            n_fev += 1
+
+            slack = tol * (np.abs(obj) + tol)
+            halvings = 0
+            while (params is not None and not (new_obj <= obj + slack) and halvings < 30):
+                new_params = (params + new_params) / 2
+                new_obj, new_hess, new_rhs = pool.irls_stats(new_params)
+                n_fev += 1
+                halvings += 1
+
+            converged = bool(np.abs(obj - new_obj) <= tol * (np.abs(new_obj) + tol))
+            params, obj, hess, rhs = new_params, new_obj, new_hess, new_rhs
+            if (self._telemetry is not None):
+                # XWz - XWX'b = X(y - mu), so the gradient comes from the statistics without another pass
+                self._record(it, obj, np.linalg.norm(rhs - hess @ params))
+            if (converged):
+                break
+
+        self._diagnostics = self._collect_diagnostics('irls', [ converged ], [ it ], [ obj ],
+            [ 'Optimization terminated successfully' if converged else 'Maximum number of iterations has been exceeded' ], [ n_fev ])
+        # The summed XWX' of the last evaluation is the Fisher information at the estimate
+        self._inference['fisher'] = hess
+        return params
+
+    ## Returns L1 and L2 penalty weights of every beta. The intercept (the first row of X) is not penalized
+    #  @param alpha penalty strength
+    #  @param L1_wt a fraction of the penalty that is L1: 1 is the lasso, 0 is the ridge
+    #  @return tuple with [p] vectors of L1 and L2 weights
+    #
+    def _penalties(self, alpha, L1_wt):
+        penalty = np.full(self._x.shape[0], float(alpha))
+        if (self._const):
+            penalty[0] = 0
+        return penalty * L1_wt, penalty * (1 - L1_wt)
+
+    ## Evaluates the penalized objective: -llik / N + sum(l1 * |b|) + sum(l2 * b^2) / 2
+    #  @param params [p] vector with betas
+    #  @param y vector with Ys
+    #  @param const constant term returned by _y_const
+    #  @param l1 [p] vector with L1 weights
+    #  @param l2 [p] vector with L2 weights
+    #  @return tuple with the objective and etas
+    #
+    def _penalized_obj(self, params, y, const, l1, l2):
+        eta = self._get_eta(params, self._x)
+        return -self._llik(eta, y, const) / len(y) + np.sum(l1 * np.abs(params)) + 0.5 * np.sum(l2 * params ** 2), eta
+
+    ## Runs coordinate descent sweeps over a quadratic approximation of the objective in the covariance form
+    #  min b'Gb / 2 - c'b + penalties. Only [p]-sized vectors are updated, so a sweep does not touch the data
+    #  @param gram [m, m] matrix G = XWX' / N of the candidate betas
+    #  @param params [m] vector with betas, updated in place
+    #  @param resid [m] vector with c - Gb, updated in place
+    #  @param l1 [m] vector with L1 weights
+    #  @param l2 [m] vector with L2 weights
+    #  @param coords indices of betas (among the candidates) that are updated
+    #  @return the largest weighted squared change of a beta
+    #
+    def _cd_sweep(self, gram, params, resid, l1, l2, coords):
+        max_change = 0.0
+        for j in coords:
+            g_jj = gram[j, j]
+            if (g_jj <= 0):
+                continue
+            grad = resid[j] + g_jj * params[j]
+            new = (grad - l1[j] if grad > l1[j] else grad + l1[j] if grad < -l1[j] else 0.0) / (g_jj + l2[j])
+            delta = new - params[j]
+            if (delta != 0):
+                resid -= delta * gram[:, j]
+                params[j] = new
+                max_change = max(max_change, g_jj * delta * delta)
+        return max_change
+
+    ## Minimizes the penalized objective for a single penalty by IRLS. Every IRLS step builds XWX' and XWz
+    #  of the candidate betas only (once for the whole fit if weights are fixed) and solves the penalized
+    #  least squares problem by coordinate descent. Sweeps run over the active set (non-zero betas) until it
+    #  settles, and a full sweep over the candidates confirms it. Betas screened out by strong rules are
+    #  checked with the KKT conditions afterwards
+    #  @param params [p] vector with initial betas
+    #  @param l1 [p] vector with L1 weights
+    #  @param l2 [p] vector with L2 weights
+    #  @param tol relative change of the objective that stops iterations
+    #  @param max_iter maximum number of IRLS iterations
+    #  @param candidates indices of betas that may be non-zero (strong rules) or None for all of them
+    #  @param cache dictionary that keeps XX' / N and Xy / N between calls when weights are fixed
+    #  @return tuple with betas, the number of iterations, the convergence flag and the objective
+    #
+    def _fit_cd(self, params, l1, l2, tol, max_iter, candidates = None, cache = None):
+        x = self._x.tocsr() if _issparse(self._x) else self._x
+        y, const = self._prepare(self._y)
+        assert y.ndim == 1, 'Regularized fits support a single response'
+        n, p = len(y), x.shape[0]
+        candidates = np.arange(p) if candidates is None else np.union1d(candidates, np.flatnonzero(l1 == 0))
+        params = np.asarray(params, dtype=float).copy()
+        obj, eta = self._penalized_obj(params, y, const, l1, l2)
+        converged, it = False, 0
+        cache = {} if cache is None else cache
+
+        while (True):
+            for it in range(it + 1, max_iter + 1):
+                if (self._fixed_weights):
+                    # Weights do not depend on betas, so the quadratic problem is exact and XX' is built once
+                    if ('gram' not in cache):
+                        cache['gram'], cache['rhs'] = self._gram(x) / n, (x @ y) / n
+                    gram, rhs = cache['gram'][np.ix_(candidates, candidates)], cache['rhs'][candidates]
+                else:
+                    mu = self._rev_link(eta)
+                    w = np.maximum(self._variance(mu), np.finfo(float).eps)
+                    x_c = x[candidates]
+                    gram, rhs = self._gram(x_c, w / n), (x_c @ (w * eta + y - mu)) / n
+
+                new_params = params.copy()
+                b = new_params[candidates]
+                resid = rhs - gram @ b
+                l1_c, l2_c = l1[candidates], l2[candidates]
+                everything = range(len(candidates))
+                tol_cd = tol * tol * max(np.max(np.diag(gram), initial=0.0), 1.0)
+                while (self._cd_sweep(gram, b, resid, l1_c, l2_c, everything) > tol_cd):
+                    active = np.flatnonzero(b)
+                    while (self._cd_sweep(gram, b, resid, l1_c, l2_c, active) > tol_cd):
+                        pass
+                new_params[candidates] = b
+
+                new_obj, new_eta = self._penalized_obj(new_params, y, const, l1, l2)
+                halvings = 0
+                # Step halving keeps the objective from increasing when the quadratic approximation is poor
+                while (new_obj > obj + tol * (abs(obj) + tol) and halvings < 30):
+                    new_params = (params + new_params) / 2
+                    new_obj, new_eta = self._penalized_obj(new_params, y, const, l1, l2)
+                    halvings += 1
+                done = abs(obj - new_obj) <= tol * (abs(new_obj) + tol)
+                params, obj, eta = new_params, new_obj, new_eta
+                if (self._telemetry is not None):
+                    self._record(it, obj, np.linalg.norm(x @ (y - self._rev_link(eta)) / n))
+                if (done or self._fixed_weights):
+                    converged = True
+                    break
+
+            # KKT conditions of the screened out betas: |x_j (y - mu)| / N <= l1_j
+            if (len(candidates) == p):
+                break
+            grad = np.abs(x @ (y - self._rev_link(eta))) / n
+            violations = np.setdiff1d(np.flatnonzero(grad > l1 * (1 + 1e-6)), candidates)
+            if (len(violations) == 0 or it >= max_iter):
+                break
+            candidates, converged = np.union1d(candidates, violations), False
+        return params, it, converged, obj
+
+    ## Estimates betas with an elastic net penalty: minimizes -llik / N + alpha * (L1_wt * |b|_1 + (1 - L1_wt) * |b|^2 / 2)
+    #  (the same objective as statsmodels' fit_regularized) by coordinate descent. The intercept is not penalized
+    #  @param alpha penalty strength
+    #  @param L1_wt a fraction of the penalty that is L1: 1 is the lasso, 0 is the ridge
+    #  @param init_param initial value for betas (a number or a [p] vector). By default zeros (and the intercept of the null model)
+    #  @param tol relative change of the objective that stops iterations
+    #  @param max_iter maximum number of IRLS iterations
+    #  @return estimated betas
+    #
+    def fit_regularized(self, alpha, L1_wt = 1.0, init_param = None, tol = 1e-8, max_iter = 100):
+        assert alpha >= 0 and 0 <= L1_wt <= 1, 'alpha should be non-negative and L1_wt should be between 0 and 1'
+        if (self._telemetry is not None):
+            self._reset_telemetry()
+        params = self._null_params() if init_param is None else self._init_params(init_param)
+        l1, l2 = self._penalties(alpha, L1_wt)
+        params, n_iter, converged, _ = self._fit_cd(params, l1, l2, tol, max_iter)
+        y, const = self._prepare(self._y)
+        self._params = params
+        # Sampling distribution of penalized betas is not given by the Fisher information
+        self._inference = { 'regularized': True }
+        self._seen_hess, self._n_seen = None, 0
+        self._diagnostics = self._collect_diagnostics('coordinate-descent', [ converged ], [ n_iter ], [ -self._llik(self._get_eta(params, self._x), y, const) ],
+            [ 'Optimization terminated successfully' if converged else 'Maximum number of iterations has been exceeded' ], [ n_iter ])
+        if (self._telemetry is not None):
+            self._telemetry['fit_time'] = time.perf_counter() - self._telemetry['_start']
+        self._fit = True
+        return self._params
+
+    ## Returns betas of the null model: the intercept (if it is used) fits the mean of Ys and other betas are zeros
+    #  @return [p] vector with betas
+    #
+    def _null_params(self):
+        params = np.zeros(self._x.shape[0])
+        if (self._const):
+            y, _ = self._prepare(self._y)
+            # With a canonical link the fitted mean of the intercept-only model equals the mean of Ys
+            with np.errstate(divide='ignore'):
+                intercept = self._link(np.mean(y))
+            params[0] = intercept if np.isfinite(intercept) else 0.0
+        return params
+
+    ## Computes the regularization path: betas for a decreasing sequence of penalties. Every penalty is warm-started
+    #  from the previous solution and the strong rules screen out betas that are likely to stay zero
+    #  @param n_alphas the number of penalties
+    #  @param L1_wt a fraction of the penalty that is L1: 1 is the lasso, 0 is the ridge
+    #  @param alpha_min_ratio the smallest penalty as a fraction of the largest one. By default 1e-3 if N > p, otherwise 1e-2
+    #  @param alphas an explicit decreasing sequence of penalties. By default it starts from the smallest penalty
+    #  that makes all penalized betas zero and decreases geometrically
+    #  @param tol relative change of the objective that stops iterations
+    #  @param max_iter maximum number of IRLS iterations for every penalty
+    #  @return dictionary with penalties, [n_alphas, p] betas, the number of non-zero betas, iterations,
+    #  convergence flags and negative loglikelihood for every penalty. The model keeps the betas of the last penalty
+    #
+    def regularization_path(self, n_alphas = 100, L1_wt = 1.0, alpha_min_ratio = None, alphas = None, tol = 1e-8, max_iter = 100):
+        assert 0 <= L1_wt <= 1, 'L1_wt should be between 0 and 1'
+        if (self._telemetry is not None):
+            self._reset_telemetry()
+        y, const = self._prepare(self._y)
+        n, p = self._x.shape[1], self._x.shape[0]
+        params = self._null_params()
+        l1_unit, l2_unit = self._penalties(1.0, L1_wt)
+        penalized = np.flatnonzero(l1_unit + l2_unit > 0)
+
+        # Gradient of -llik / N at the null model gives the smallest penalty with all penalized betas at zero
+        grad = np.abs(self._x @ (y - self._rev_link(self._get_eta(params, self._x)))) / n
+        if (alphas is None):
+            alpha_max = np.max(grad[penalized]) / max(L1_wt, 1e-3) if len(penalized) > 0 else 0.0
+            ratio = alpha_min_ratio if alpha_min_ratio is not None else (1e-3 if n > p else 1e-2)
+            alphas = alpha_max * np.geomspace(1, ratio, n_alphas) if alpha_max > 0 else np.zeros(1)
+        alphas = np.asarray(alphas, dtype=float)
+
+        path = np.empty((len(alphas), p))
+        n_iter, converged, neg_llik, cache = [], [], [], {}
+        prev_alpha = alphas[0]
+        for i, alpha in enumerate(alphas):
+            l1, l2 = l1_unit * alpha, l2_unit * alpha
+            # Strong rules: a beta is skipped if its gradient is well below the new penalty
+            candidates = None
+            if (L1_wt > 0):
+                candidates = np.flatnonzero((grad >= L1_wt * (2 * alpha - prev_alpha)) | (params != 0) | (l1 == 0))
+            params, it, conv, _ = self._fit_cd(params, l1, l2, tol, max_iter, candidates, cache)
+            eta = self._get_eta(params, self._x)
+            grad = np.abs(self._x @ (y - self._rev_link(eta))) / n
+            path[i] = params
+            n_iter.append(it)
+            converged.append(conv)
+            neg_llik.append(float(-self._llik(eta, y, const)))
+            prev_alpha = alpha
+
+        self._params = params
+        self._inference = { 'regularized': True }
+        self._seen_hess, self._n_seen = None, 0
+        self._diagnostics = self._collect_diagnostics('coordinate-descent', [ converged[-1] ], [ sum(n_iter) ], [ neg_llik[-1] ],
+            [ 'Optimization terminated successfully' if all(converged) else f'{len(converged) - sum(converged)} penalties did not converge' ], [ sum(n_iter) ])
+        if (self._telemetry is not None):
+            self._telemetry['fit_time'] = time.perf_counter() - self._telemetry['_start']
+        self._fit = True
+        return {
+            'alphas': alphas,
+            'params': path,
+            'n_nonzero': np.count_nonzero(path[:, penalized], axis=1),
+            'n_iter': np.array(n_iter),
+            'converged': np.array(converged),
+            'neg_llik': np.array(neg_llik),
+        }
+
+    ## Computes IRLS sufficient statistics of a block of observations: XWX' and XWz for every response
+    #  @param x [p, n] block of Xs
+    #  @param y [n, k] block of Ys
+    #  @param eta [n, k] matrix with etas
+    #  @param mu [n, k] matrix with mus
+    #  @return tuple with a [k, p, p] array of XWX' and a [p, k] matrix of XWz
+    #
+    def _block_stats(self, x, y, eta, mu):
+        w = np.maximum(self._variance(mu), np.finfo(float).eps)
+        z = eta + (y - mu) / w
+        return self._gram(x, w), x @ (w * z)
+
+    ## Estimates betas from data that does not fit into memory. Every IRLS iteration makes one pass over
+    #  the blocks and accumulates sufficient statistics (X'X and X'y for the Normal GLM, which is solved
+    #  in a single pass, and gradient and Hessian sums for other families)
+    #  @param chunks a function without arguments returning a new iterator of (x_block, y_block) tuples
+    #  with the format [p, n] and [k, n], e.g. lambda: loader.chunks(100000)
+    #  @param init_param initial value for betas. By default IRLS starts from Ys
+    #  @param tol relative change of negative loglikelihood that stops iterations
+    #  @param max_iter maximum number of passes over the data
+    #  @return estimated betas
+    #
+    def fit_stream(self, chunks, init_param = None, tol = 1e-8, max_iter = 100):
+        params = None if init_param is None else self._init_params(init_param)
+        obj = np.inf
+        converged = False
+        for it in range(1, max_iter + 1):
+            hess, rhs, new_obj, n, y_sums = 0, 0, 0, 0, 0
+            for x_block, y_block in chunks():
+                y = np.asarray(y_block, dtype=float).T
+                if (params is None):
+                    eta = self._link(self._init_mu(y))
+                else:
+                    eta = self._get_eta(params.reshape(x_block.shape[0], -1), x_block)
+                mu = self._rev_link(eta)
+                new_obj = new_obj - self._llik(eta, y, self._y_const(y))
+                block_hess, block_rhs = self._block_stats(x_block, y, eta, mu)
+                hess, rhs, n = hess + block_hess, rhs + block_rhs, n + x_block.shape[1]
+                y_sums = y_sums + np.stack([ np.sum(y, axis=0), np.sum(np.square(y), axis=0) ])
+            assert n > 0, 'chunks() did not yield any observations'
+
+            # Objective is evaluated at the current betas, so convergence is checked before the next update
+            if (params is not None and np.all(np.abs(obj - new_obj) <= tol * (np.abs(new_obj) + tol))):
+                converged = True
+                break
+            params = np.stack([ cho_solve(cho_factor(h), r) for h, r in zip(hess, rhs.T) ], axis=1)
+            obj = new_obj
+            # With fixed weights the normal equations are exact after a single pass
+            if (self._fixed_weights):
+                converged = True
+                break
+
+        k = params.shape[1] if params.ndim == 2 else 1
+        obj = np.broadcast_to(obj, (k,))
+        self._diagnostics = self._collect_diagnostics('irls-stream', [ converged ] * k, [ it ] * k, obj,
+            [ 'Optimization terminated successfully' if converged else 'Maximum number of iterations has been exceeded' ] * k, [ it ] * k)
+        self._params = params[:, 0] if params.ndim == 2 and k == 1 else params
+        # The last pass accumulated XWX' at the estimate (for the Normal GLM it does not depend on betas)
+        self._inference = { 'fisher': hess[0] if k == 1 else hess, 'nobs': n }
+        self._inference.update(self._stream_stats(params, hess, rhs, y_sums, n))
+        self._seen_hess, self._n_seen = None, 0
+        self._fit = True
+        return self._params
+
+    ## Computes fit statistics of fit_stream() from the sums of its last pass. Families whose statistics
+    #  do not follow from these sums return none, so only the Fisher information is kept
+    #  @param params [p, k] matrix with estimated betas
+    #  @param hess [k, p, p] array with summed XWX'
+    #  @param rhs [p, k] matrix with summed XWz
+    #  @param y_sums [2, k] matrix with sums of Ys and of their squares
+    #  @param n the number of observations
+    #  @return dictionary with statistics (see _stats())
+    #
+    def _stream_stats(self, params, hess, rhs, y_sums, n):
+        return {}
+
+    ## Updates the fit with a new block of observations without reprocessing the previous ones.
+    #  Previously seen data is summarized by its accumulated Fisher information around the current betas,
+    #  so the update is exact for the Normal GLM and a second order approximation for other families.
+    #  A model estimated by fit() or fit_stream() is updated starting from its betas and Fisher information
+    #  @param x_block [p, n] matrix with new Xs
+    #  @param y_block [k, n] matrix with new Ys
+    #  @param tol relative change of betas that stops Newton iterations on the new block
+    #  @param max_iter maximum number of Newton iterations
+    #  @return updated betas
+    #
+    def partial_fit(self, x_block, y_block, tol = 1e-8, max_iter = 100):
+        y = np.asarray(y_block, dtype=float).T
+        p, k = x_block.shape[0], y.shape[1]
+        deviance = self._inference.get('deviance')
+        if (self._seen_hess is None and self._fit):
+            self._seen_hess, self._n_seen, deviance = self._prior_information(p, k)
+        if (self._seen_hess is None):
+            seen_hess, prior, deviance = np.zeros((k, p, p)), np.zeros((p, k)), np.zeros(k)
+            eta = self._link(self._init_mu(y))
+        else:
+            seen_hess, prior = self._seen_hess, self._params.reshape(p, -1)
+            eta = self._get_eta(prior, x_block)
+
+        params = prior
+        for it in range(1, max_iter + 1):
+            # IRLS step for the block's loglikelihood plus the quadratic summary of previous blocks
+            hess, rhs = self._block_stats(x_block, y, eta, self._rev_link(eta))
+            rhs = rhs + np.einsum('kpq,qk->pk', seen_hess, prior)
+            new_params = np.stack([ cho_solve(cho_factor(h), r) for h, r in zip(seen_hess + hess, rhs.T) ], axis=1)
+            change = np.max(np.abs(new_params - params))
+            params = new_params
+            eta = self._get_eta(params, x_block)
+            if (change <= tol * (np.max(np.abs(params)) + tol)):
+                break
+
+        mu = self._rev_link(eta)
+        self._seen_hess = seen_hess + self._gram(x_block, self._variance(mu))
+        self._n_seen += x_block.shape[1]
+        self._params = params[:, 0] if k == 1 else params
+        # The accumulated information of all blocks approximates the Fisher information at the estimate
+        self._inference = { 'fisher': self._seen_hess[0] if k == 1 else self._seen_hess,
+                            'nobs': self._n_seen, 'df_model': p - 1, 'df_resid': self._n_seen - p }
+        if (deviance is not None):
+            # The deviance of previous blocks grows by the quadratic form of their information in the change of betas
+            # (exactly for the Normal GLM, whose previous betas minimized it), the new block adds its own deviance
+            step = params - prior
+            deviance = np.reshape(deviance, (k,)) + np.einsum('pk,kpq,qk->k', step, seen_hess, step) + np.sum(self._unit_deviance(y, mu), axis=0)
+            self._inference['deviance'] = deviance[0] if k == 1 else deviance
+            if (self._estimate_scale):
+                # Errors of the Normal GLM have unit variance function, so Pearson chi2 equals the deviance
+                self._inference['pearson_chi2'] = self._inference['deviance']
+                self._inference['scale'] = self._inference['deviance'] / self._inference['df_resid']
+        self._fit = True
+        return self._params
+
+    ## Summarizes the data of an existing fit by its Fisher information at the estimate, so partial_fit
+    #  can continue from it
+    #  @param p the number of Xs of new blocks
+    #  @param k the number of responses of new blocks
+    #  @return tuple with the [k, p, p] Fisher information, the number of observations it summarizes and
+    #  their deviance (None if it is unknown)
+    #
+    def _prior_information(self, p, k):
+        if (self._inference.get('regularized')):
+            raise Exception('A regularized fit cannot be updated by partial_fit')
+        params = self._params.reshape(-1, k) if np.ndim(self._params) == 2 else self._params
+        if (np.shape(params)[0] != p or np.size(params) != p * k):
+            raise Exception(f'New blocks have {p} Xs and {k} responses, which does not match the fitted betas')
+        if (self._has_training_data() or 'llf' in self._inference):
+            stats = self._stats()
+        elif ('fisher' in self._inference):
+            stats = self._inference
+        else:
+            raise Exception('Neither the Fisher information nor the training data of the fit is available, so it cannot be updated')
+        return np.reshape(stats['fisher'], (k, p, p)), stats.get('nobs', 0), stats.get('deviance')
+
+    ## Evaluates the deviance of the fitted model on (possibly new) observations
+    #  @param x [p, N] matrix with Xs. By default the deviance of the training data is returned
+    #  @param y [k, N] matrix with Ys
+    #  @return deviance (one per response)
+    #
+    def deviance(self, x = None, y = None):
+        self._check_fit()
+        if (x is None and y is None):
+            return self._stats()['deviance']
+        y, _ = self._prepare(y)
+        mu = self._rev_link(self._get_eta(self._params, x))
+        return np.sum(self._unit_deviance(y, mu), axis=0)
+
+    ## Evaluates the loglikelihood reported by summary() and used by AIC. By default it equals the loglikelihood
+    #  maximized by fit(). Families with an estimated scale override it
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @param deviance deviance at eta (one per response)
+    #  @return loglikelihood (one per response)
+    #
+    def _llf(self, eta, y, const, deviance):
+        return self._llik(eta, y, const)
+
+    ## Evaluates the loglikelihood of the null (intercept only) model reported next to the fitted one
+    #  @param eta vector (or [N, k] matrix) with etas of the null model
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @param deviance deviance of the null model (one per response)
+    #  @param scale scale estimated for the fitted model (one per response)
+    #  @return loglikelihood (one per response)
+    #
+    def _llnull(self, eta, y, const, deviance, scale):
+        return self._llf(eta, y, const, deviance)
+
+    ## Tells whether the training data describes the fit. Blocks passed to partial_fit() are not kept,
+    #  so after it the training data (if any) is only a part of the observations
+    #  @return True if statistics can be computed from the training data
+    #
+    def _has_training_data(self):
+        return self._x is not None and self._y is not None and self._n_seen == 0
+
+    ## Computes goodness-of-fit statistics on the training data in a single pass. The Fisher information
+    #  is also computed there unless the fit has kept it. Results are cached until the next fit
+    #  @return dictionary with nobs, df_model, df_resid, deviance, null_deviance, pearson_chi2, llf, llnull, scale and fisher
+    #
+    def _stats(self):
+        self._check_fit()
+        stats = self._inference
+        if ('llf' not in stats):
+            if (not self._has_training_data()):
+                raise Exception('Training data is not available, so deviance and the scale cannot be computed')
+            x = self._x
+            y, const = self._prepare(self._y)
+            eta = self._get_eta(self._params, x)
+            mu = self._rev_link(eta)
+            var = np.maximum(self._variance(mu), np.finfo(float).eps)
+            n, p = y.shape[0], x.shape[0]
+            deviance = np.sum(self._unit_deviance(y, mu), axis=0)
+            # The null model has only an intercept. With a canonical link its fitted mean is the mean of Ys
+            mu_null = np.broadcast_to(np.mean(y, axis=0), y.shape)
+            with np.errstate(divide='ignore'):
+                eta_null = self._link(mu_null)
+            null_deviance = np.sum(self._unit_deviance(y, mu_null), axis=0)
+            stats.update({
+                'nobs': n, 'df_model': p - 1, 'df_resid': n - p,
+                'deviance': deviance, 'null_deviance': null_deviance,
+                'pearson_chi2': np.sum(np.square(y - mu) / var, axis=0),
+            })
+            stats['scale'] = stats['pearson_chi2'] / stats['df_resid'] if self._estimate_scale else np.ones_like(deviance)
+            stats['llf'] = self._llf(eta, y, const, deviance)
+            stats['llnull'] = self._llnull(eta_null, y, const, null_deviance, stats['scale'])
+            if ('fisher' not in stats):
+                stats['fisher'] = self._gram(x, var)
+        return stats
+
+    ## Returns the covariance matrix of betas: the scale times the inverse of the Fisher information at the estimate
+    #  @return [p, p] matrix (or a [k, p, p] array for several responses)
+    #
+    @property
+    def cov_params(self):
+        self._check_fit()
+        if (self._inference.get('regularized')):
+            raise Exception('Covariance of betas is not available for regularized fits')
+        if ('cov' not in self._inference):
+            if ('fisher' not in self._inference or (self._estimate_scale and 'scale' not in self._inference)):
+                self._stats()
+            scale = self._inference['scale'] if self._estimate_scale else 1.0
+            self._inference['cov'] = np.asarray(scale)[..., None, None] * np.linalg.inv(self._inference['fisher'])
+        return self._inference['cov']
+
+    ## Returns standard errors of betas
+    #  @return array with the same shape as params
+    #
+    @property
+    def bse(self):
+        bse = np.sqrt(np.diagonal(self.cov_params, axis1=-2, axis2=-1))
+        return bse if bse.ndim == 1 else bse.T
+
+    ## Returns z-statistics of betas (Wald tests of beta = 0)
+    #  @return array with the same shape as params
+    #
+    @property
+    def zvalues(self):
+        return self._params / self.bse
+
+    ## Returns two-sided p-values of the z-statistics
+    #  @return array with the same shape as params
+    #
+    @property
+    def pvalues(self):
+        return 2 * ndtr(-np.abs(self.zvalues))
+
+    ## Returns Wald confidence intervals of betas
+    #  @param alpha significance level
+    #  @return array with lower and upper bounds in the last axis: [p, 2] (or [p, k, 2] for several responses)
+    #
+    def conf_int(self, alpha = 0.05):
+        q = ndtri(1 - alpha / 2)
+        params, bse = self._params, self.bse
+        return np.stack([ params - q * bse, params + q * bse ], axis=-1)
+
+    ## Returns the loglikelihood of the fitted model (with the estimated scale for the Normal GLM, as in statsmodels)
+    #  @return loglikelihood (one per response)
+    #
+    @property
+    def llf(self):
+        return self._stats()['llf']
+
+    ## Returns Akaike information criterion: -2 * loglikelihood + 2 * p
+    #  @return AIC (one per response)
+    #
+    @property
+    def aic(self):
+        return -2 * self.llf + 2 * self._params.shape[0]
+
+    ## Prints results of model estimation: fit statistics and a table with betas, standard errors,
+    #  z-statistics, p-values and 95% confidence intervals (one block per response). Without training data
+    #  or saved statistics (e.g. after partial_fit()) the table is built from the Fisher information and
+    #  unknown statistics are left blank. If even that is not available only betas are printed
     #
     def summary(self):
+        self._check_fit()
         # We add + int(not self._const) since indices start from 0 if the intercept was used and 1 otherwise
-        summary = '\n'.join([f'x{i + int(not self._const)}: {value:>12.6f}' for i, value in enumerate(self._params)])
-        print(summary)
+        names = self._metadata.get('feature_names') or [ f'x{i + int(not self._const)}' for i in range(self._params.shape[0]) ]
+        if (self._has_training_data() or 'llf' in self._inference):
+            stats = self._stats()
+        elif ('fisher' in self._inference and (not self._estimate_scale or 'scale' in self._inference)):
+            stats = self._inference
+        else:
+            # Each row contains betas of a single x for every response
+            print('\n'.join([f'{name}: ' + ' '.join([f'{value:>12.6f}' for value in np.atleast_1d(row)]) for name, row in zip(names, self._params)]))
+            return
+
+        regularized = bool(self._inference.get('regularized'))
+        columns = [ self._params ] if regularized else [ self._params, self.bse, self.zvalues, self.pvalues, *np.moveaxis(self.conf_int(), -1, 0) ]
+        single = self._params.ndim == 1
+        for j in range(1 if single else self._params.shape[1]):
+            take = lambda value: value if single or np.ndim(value) == 0 else np.asarray(value)[..., j]
+            diagnostics = { key: take(value) for key, value in self._diagnostics.items() if key != 'message' }
+            # Statistics that are not known (e.g. after partial_fit()) are left blank
+            value = lambda key, fmt: format(float(take(stats[key])), fmt) if key in stats else ''
+            llf = float(take(stats['llf'])) if 'llf' in stats else None
+            left = [ ('Model Family:', type(self).__name__.replace('GLM', '')), ('Link Function:', self._link_name),
+                     ('Method:', diagnostics.get('method', '')), ('No. Iterations:', diagnostics.get('n_iter', '')),
+                     ('Converged:', diagnostics.get('converged', '')), ('Covariance Type:', 'penalized' if regularized else 'nonrobust') ]
+            right = [ ('No. Observations:', stats.get('nobs', '')), ('Df Residuals:', stats.get('df_resid', '')), ('Df Model:', stats.get('df_model', '')),
+                      ('Scale:', value('scale', '.4f') if self._estimate_scale else f'{1:.4f}'), ('Log-Likelihood:', value('llf', '.2f')),
+                      ('Deviance:', value('deviance', '.2f')), ('Pearson chi2:', value('pearson_chi2', '.3g')),
+                      ('AIC:', '' if llf is None else f'{-2 * llf + 2 * len(names):.2f}'),
+                      ('Pseudo R-squ. (CS):', '' if llf is None else f'{1 - np.exp(2 * (float(take(stats["llnull"])) - llf) / stats["nobs"]):.4f}') ]
+            title = 'Generalized Linear Model Regression Results' + ('' if single else f' (response {j + 1})')
+            lines = [ f'{title:^78}', '=' * 78 ]
+            lines += [ f'{l[0]:<16}{str(l[1]):>22}   {r[0]:<20}{str(r[1]):>17}' for l, r in zip(left + [ ('', '') ] * (len(right) - len(left)), right) ]
+            lines += [ '=' * 78, f'{"":<18}' + ''.join([ f'{header:>10}' for header in [ 'coef', 'std err', 'z', 'P>|z|', '[0.025', '0.975]' ][:len(columns)] ]), '-' * 78 ]
+            lines += [ f'{name:<18.18}' + ''.join([ f'{float(take(column)[i]):>10.4f}' if c in (0, 1) else f'{float(take(column)[i]):>10.3f}'
+                                                  for c, column in enumerate(columns) ]) for i, name in enumerate(names) ]
+            lines.append('=' * 78)
+            print('\n'.join(lines))
+
+    ## Tells whether the training data of every response is (quasi-)completely separated. The MLE does not exist then:
+    #  betas grow until the optimizer stops and its convergence flag is meaningless. Only binary responses can be separated
+    #  @return boolean array with one value per response
+    #
+    def separated(self):
+        self._check_fit()
+        assert self._has_training_data(), 'Separation can only be checked on the training data of the fit'
+        return np.zeros(self._y.shape[0], dtype=bool)
 
     ## Estimate values for Ys based on Xs using estimated betas
     #  @param new_x matrix of Xs used to predict Ys
@@ -90,4 +1259,137 @@ class GLMBase:
         self._check_fit()
         eta = self._get_eta(self._params, new_x)
         mu = self._rev_link(eta)
-        return mu
+        # Several responses are returned in the same [k, N] format as Ys
+        return mu if mu.ndim == 1 else mu.T
+
+    ## Estimates Ys for a large (e.g. memory-mapped) matrix of Xs block by block. Only one block of etas
+    #  is computed at a time and mus are written straight into a preallocated output, so memory does not grow with N
+    #  @param new_x [p, N] matrix of Xs (a numpy array, a np.memmap or a scipy.sparse matrix)
+    #  @param chunksize the number of observations in every block
+    #  @param out optional preallocated output: [N] for a single response or [k, N] for several ones
+    #  @param dtype float64 or float32. float32 halves memory traffic at the cost of precision
+    #  @return the output with predicted values for Ys
+    #
+    def predict_batch(self, new_x, chunksize = 65536, out = None, dtype = np.float64):
+        self._check_fit()
+        assert chunksize > 0, 'chunksize should be positive'
+        dtype = np.dtype(dtype)
+        if (dtype not in (np.float32, np.float64)):
+            raise Exception(f'Unsupported dtype of predictions: {dtype}. Expected float32 or float64')
+        params = np.asarray(self._params, dtype=dtype)
+        assert new_x.shape[0] == params.shape[0], f'Expected {params.shape[0]} rows of Xs. Got: {new_x.shape[0]}'
+        n = new_x.shape[1]
+        shape = (n,) if params.ndim == 1 else (params.shape[1], n)
+        if (out is None):
+            out = np.empty(shape, dtype=dtype)
+        assert out.shape == shape and out.dtype == dtype, f'out should be a {dtype} array with the shape {shape}'
+
+        for start in range(0, n, chunksize):
+            block = new_x[:, start:start + chunksize]
+            if (not _issparse(block)):
+                block = block.astype(dtype, copy=False)
+            # Etas are computed in the output itself ([n, k] view of the [k, n] block) and turned into mus in place
+            target = out[start:start + chunksize] if params.ndim == 1 else out[:, start:start + chunksize].T
+            eta = self._get_eta(params, block, out=target)
+            self._rev_link(eta, out=eta)
+        return out
+
+    ## Serializes the fitted model into a compact artifact: the family, its link, betas and metadata.
+    #  Xs and Ys used for training are not stored. The format is the magic bytes, the length of a JSON header,
+    #  the header and raw arrays, so it is loaded without parsing numbers or unpickling objects
+    #  @param metadata optional JSON-serializable dictionary stored with the model (e.g. feature names)
+    #  @return bytes with the artifact
+    #
+    def to_bytes(self, metadata = None):
+        self._check_fit()
+        if (GLMBase._families.get(type(self).__name__) != type(self).__module__):
+            raise Exception(f'{type(self).__name__} is not a registered family, so it cannot be saved')
+        arrays = { 'params': np.ascontiguousarray(self._params, dtype=np.float64) }
+        # The Fisher information of seen observations lets partial_fit() continue after loading
+        if (self._seen_hess is not None):
+            arrays['seen_hess'] = np.ascontiguousarray(self._seen_hess, dtype=np.float64)
+        # Fit statistics and the Fisher information are kept, so a loaded model has standard errors and a full summary
+        if (self._has_training_data()):
+            self._stats()
+        inference = { key: value for key, value in self._inference.items() if key not in ('fisher', 'cov') }
+        if ('fisher' in self._inference):
+            arrays['fisher'] = np.ascontiguousarray(self._inference['fisher'], dtype=np.float64)
+        header = {
+            'version': GLMBase._format_version,
+            'family': type(self).__name__,
+            'link': self._link_name,
+            'const': self._const,
+            'n_seen': self._n_seen,
+            'diagnostics': { key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in self._diagnostics.items() },
+            'inference': { key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in inference.items() },
+            'metadata': metadata or {},
+            'arrays': {},
+        }
+        offset = 0
+        for name, array in arrays.items():
+            header['arrays'][name] = { 'shape': list(array.shape), 'dtype': array.dtype.str, 'offset': offset }
+            offset += array.nbytes
+        header = json.dumps(header).encode()
+        return b''.join([ GLMBase._magic, struct.pack('<I', len(header)), header ] + [ array.tobytes() for array in arrays.values() ])
+
+    ## Restores a model serialized by to_bytes(). Called on a subclass, it also checks that the artifact is of that family
+    #  @param data bytes with the artifact
+    #  @return fitted model of the saved family. It can predict, but it has no training data
+    #
+    @classmethod
+    def from_bytes(cls, data):
+        data = memoryview(data)
+        if (bytes(data[:4]) != GLMBase._magic):
+            raise Exception('Data is not a saved GLM')
+        length = struct.unpack('<I', data[4:8])[0]
+        header = json.loads(bytes(data[8:8 + length]))
+        if (header['version'] != GLMBase._format_version):
+            raise Exception(f'Unsupported version of the saved GLM: {header["version"]}. Expected {GLMBase._format_version}')
+        if (header['family'] not in GLMBase._families):
+            raise Exception(f'Unknown family of the saved GLM: {header["family"]}. Expected one of {", ".join(GLMBase._families)}')
+        family = getattr(importlib.import_module(GLMBase._families[header['family']]), header['family'])
+        if (not issubclass(family, cls)):
+            raise Exception(f'Saved model {header["family"]} is not a {cls.__name__}')
+        if (family._link_name != header['link']):
+            raise Exception(f'Saved model uses the {header["link"]} link, but {header["family"]} uses {family._link_name}')
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=8 + length + spec['offset']).reshape(spec['shape']).copy()
+        model = family(None, None, header['const'])
+        model._params = arrays['params']
+        model._seen_hess = arrays.get('seen_hess')
+        model._n_seen = header['n_seen']
+        model._diagnostics = { key: np.array(value) if isinstance(value, list) else value for key, value in header['diagnostics'].items() }
+        model._metadata = header['metadata']
+        model._inference = { key: np.array(value) if isinstance(value, list) else value for key, value in header['inference'].items() }
+        if ('fisher' in arrays):
+            model._inference['fisher'] = arrays['fisher']
+        model._fit = True
+        return model
+
+    ## Saves the fitted model to a file (see to_bytes())
+    #  @param path path to the file
+    #  @param metadata optional JSON-serializable dictionary stored with the model
+    #
+    def save(self, path, metadata = None):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes(metadata))
+
+    ## Loads a model saved by save()
+    #  @param path path to the file
+    #  @return fitted model of the saved family
+    #
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    ## Returns metadata stored with a loaded model
+    #  @return dictionary with metadata
+    #
+    @property
+    def metadata(self):
+        return dict(self._metadata)
@@ -2,15 +2,18 @@
 #  This module defines a subclass for Bernoulli GLM
 #
 import numpy as np
-from scipy.stats import bernoulli
+from scipy.special import expit, logit, xlogy
 from models.GLMBase import GLMBase
 
 ## A subclass that is used to build a Bernoulli GLM
 #
 class GLMBernoulli(GLMBase):
+    # The canonical link, which is recorded in saved models
+    _link_name = 'logit'
+
     ## Constructs the Bernoulli GLM subclass
     #  @param x a matrix of exogenous variables with the next format: [p, N]
-    #  @param y a matrix of endogenous variables with the next format: [p, N]
+    #  @param y a matrix of endogenous variables with the next format: [k, N], where k is the number of responses
     #  @param const a boolean that tells whether the interception point is used
     #
     def __init__(self, x, y, const):
@@ -18,22 +21,80 @@ class GLMBernoulli(GLMBase):
     
     ## Defines a reverse model's link function
     #  @param eta matrix multiplication product for betas and Xs
+    #  @param out optional preallocated array to store mus in (it may be eta itself)
     #  @return matrix of mus calculated by this function
     #
-    def _rev_link(self, eta):
-        return np.exp(eta) / (1 + np.exp(eta))
+    def _rev_link(self, eta, out = None):
+        return expit(eta, out=out)
+
+    ## Defines a model's link function
+    #  @param mu matrix of mus
+    #  @return matrix of etas calculated by this function
+    #
+    def _link(self, mu):
+        return logit(mu)
 
-    ## Evaluates negative loglikelihood for the given model.
-    #  @param params matrix with betas
-    #  @param x matrix with Xs used for training
+    ## Provides starting values of mu for IRLS, which are kept away from 0 and 1
     #  @param y matrix with Ys used for training
-    #  @return negative loglikelihood for given inputs
+    #  @return matrix of initial mus
+    #
+    def _init_mu(self, y):
+        return (y + 0.5) / 2
+
+    ## Defines a model's variance function
+    #  @param mu matrix of mus
+    #  @return matrix of variances evaluated at mu
+    #
+    def _variance(self, mu):
+        return mu * (1 - mu)
+
+    ## Defines a model's unit deviance: 2 * (y * log(y / mu) + (1 - y) * log((1 - y) / (1 - mu))).
+    #  xlogy makes the terms with y = 0 or y = 1 equal to 0
+    #  @param y matrix with Ys
+    #  @param mu matrix of mus
+    #  @return matrix with the deviance of every observation
+    #
+    def _unit_deviance(self, y, mu):
+        return 2 * (xlogy(y, y) - xlogy(y, mu) + xlogy(1 - y, 1 - y) - xlogy(1 - y, 1 - mu))
+
+    ## Evaluates loglikelihood directly from eta: y * eta - log(1 + exp(eta)).
+    #  logaddexp is used so that large etas do not overflow
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @return loglikelihood (one per response)
+    #
+    def _llik(self, eta, y, const):
+        log1p_exp = np.logaddexp(0, eta, out=self._buffer('tmp', eta.shape))
+        return const + np.einsum('n...,n...->...', y, eta) - np.sum(log1p_exp, axis=0)
+
+    ## Evaluates loglikelihood and mus in a single pass
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @return tuple with loglikelihood (one per response) and mus
+    #
+    def _kernel(self, eta, y, const):
+        return self._llik(eta, y, const), expit(eta, out=self._buffer('mu', eta.shape))
+
+    ## Tells whether the training data of every response is (quasi-)completely separated: some direction d of betas
+    #  has x'd >= 0 for all observations with y = 1, x'd <= 0 for all with y = 0 and is not 0 everywhere. Then
+    #  loglikelihood keeps increasing along d and the fitted mus of the separated observations approach their Ys.
+    #  The linear program max sum((2y - 1) * x'd) s.t. (2y - 1) * x'd >= 0, |d| <= 1 is solved only for
+    #  responses with such observations
+    #  @return boolean array with one value per response
     #
-    def _neg_llik(self, params, x, y):
-        eta = self._get_eta(params, x)
-        mu = self._rev_link(eta)
-        llik = np.sum((bernoulli.logpmf(y, mu)))
-        return -llik
+    def separated(self):
+        separated = super().separated()
+        mu = self.predict(self._x).reshape(self._y.shape)
+        for r in np.flatnonzero(np.any(np.abs(self._y - mu) < 1e-6, axis=1)):
+            from scipy.optimize import linprog
+            sign = 2 * self._y[r].astype(float) - 1
+            # Rows of a hold signed observations: a @ d = (2y - 1) * x'd
+            a = (self._x.multiply(sign[None, :]).tocsr() if hasattr(self._x, 'multiply') else self._x * sign).T
+            res = linprog(-np.asarray(a.sum(axis=0)).ravel(), A_ub=-a, b_ub=np.zeros(a.shape[0]), bounds=(-1, 1), method='highs')
+            separated[r] = res.status == 0 and -res.fun > 1e-8 * max(abs(a).sum(), 1)
+        return separated
 
     ## Prints results of model estimation
     #
@@ -2,15 +2,21 @@
 #  This module defines a subclass for Normal GLM
 #
 import numpy as np
-from scipy.stats import norm
 from models.GLMBase import GLMBase
 
 ## A subclass that is used to build a Normal GLM
 #
 class GLMNormal(GLMBase):
+    # IRLS weights are always 1, so the design is factorized once per fit
+    _fixed_weights = True
+    # The canonical link, which is recorded in saved models
+    _link_name = 'identity'
+    # The variance of errors is estimated by Pearson chi2 / residual df, as in statsmodels
+    _estimate_scale = True
+
     ## Constructs the Normal GLM subclass
     #  @param x a matrix of exogenous variables with the next format: [p, N]
-    #  @param y a matrix of endogenous variables with the next format: [p, N]
+    #  @param y a matrix of endogenous variables with the next format: [k, N], where k is the number of responses
     #  @param const a boolean that tells whether the interception point is used
     #
     def __init__(self, x, y, const):
@@ -18,22 +24,107 @@ class GLMNormal(GLMBase):
     
     ## Defines a reverse model's link function
     #  @param eta matrix multiplication product for betas and Xs
+    #  @param out optional preallocated array to store mus in (it may be eta itself)
     #  @return matrix of mus calculated by this function
     #
-    def _rev_link(self, eta):
-        return eta
+    def _rev_link(self, eta, out = None):
+        if (out is None or out is eta):
+            return eta
+        out[...] = eta
+        return out
+
+    ## Defines a model's link function
+    #  @param mu matrix of mus
+    #  @return matrix of etas calculated by this function
+    #
+    def _link(self, mu):
+        return mu
+
+    ## Defines a model's variance function
+    #  @param mu matrix of mus
+    #  @return matrix of variances evaluated at mu
+    #
+    def _variance(self, mu):
+        return np.ones_like(mu)
+
+    ## Defines the part of loglikelihood that depends only on Ys (unit variance is assumed)
+    #  @param y vector (or [N, k] matrix) of Ys
+    #  @return constant term of loglikelihood (one per response)
+    #
+    def _y_const(self, y):
+        return -0.5 * y.shape[0] * np.log(2 * np.pi)
+
+    ## Defines a model's unit deviance: squared residuals
+    #  @param y matrix with Ys
+    #  @param mu matrix of mus
+    #  @return matrix with the deviance of every observation
+    #
+    def _unit_deviance(self, y, mu):
+        return np.square(y - mu)
+
+    ## Evaluates loglikelihood directly from eta
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @return loglikelihood (one per response)
+    #
+    def _llik(self, eta, y, const):
+        resid = np.subtract(y, eta, out=self._buffer('resid', y.shape))
+        return const - 0.5 * np.einsum('n...,n...->...', resid, resid)
+
+    ## Evaluates the loglikelihood with the maximum likelihood estimate of the variance (deviance / N),
+    #  which is what statsmodels reports, instead of the unit variance used while fitting
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @param deviance deviance at eta (one per response)
+    #  @return loglikelihood (one per response)
+    #
+    def _llf(self, eta, y, const, deviance):
+        n = y.shape[0]
+        return self._gaussian_llf(n, deviance, deviance / n)
+
+    ## Evaluates the loglikelihood of the null model with the scale of the fitted one, as statsmodels does
+    #  @param eta vector (or [N, k] matrix) with etas of the null model
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @param deviance deviance of the null model (one per response)
+    #  @param scale scale estimated for the fitted model (one per response)
+    #  @return loglikelihood (one per response)
+    #
+    def _llnull(self, eta, y, const, deviance, scale):
+        return self._gaussian_llf(y.shape[0], deviance, scale)
+
+    ## Computes fit statistics of fit_stream() without another pass: with unit weights its sums are X'X and X'y,
+    #  so the residual sum of squares is y'y - 2b'X'y + b'X'Xb and the null one is y'y - (sum of Ys)^2 / N
+    #  @param params [p, k] matrix with estimated betas
+    #  @param hess [k, p, p] array with summed X'X
+    #  @param rhs [p, k] matrix with summed X'y
+    #  @param y_sums [2, k] matrix with sums of Ys and of their squares
+    #  @param n the number of observations
+    #  @return dictionary with statistics (see _stats())
+    #
+    def _stream_stats(self, params, hess, rhs, y_sums, n):
+        p, k = params.shape
+        y_sum, y_squares = y_sums
+        fitted = np.einsum('pk,kpq,qk->k', params, hess, params)
+        deviance = np.maximum(y_squares - 2 * np.einsum('pk,pk->k', params, rhs) + fitted, 0)
+        null_deviance = np.maximum(y_squares - np.square(y_sum) / n, 0)
+        scale = deviance / (n - p)
+        stats = { 'deviance': deviance, 'null_deviance': null_deviance, 'pearson_chi2': deviance, 'scale': scale,
+                  'llf': self._gaussian_llf(n, deviance, deviance / n), 'llnull': self._gaussian_llf(n, null_deviance, scale) }
+        stats = { key: value[0] if k == 1 else value for key, value in stats.items() }
+        stats.update({ 'nobs': n, 'df_model': p - 1, 'df_resid': n - p })
+        return stats
 
-    ## Evaluates negative loglikelihood for the given model.
-    #  @param params matrix with betas
-    #  @param x matrix with Xs used for training
-    #  @param y matrix with Ys used for training
-    #  @return negative loglikelihood for given inputs
+    ## Evaluates the Normal loglikelihood from the sum of squared residuals
+    #  @param n the number of observations
+    #  @param deviance sum of squared residuals (one per response)
+    #  @param scale variance of errors (one per response)
+    #  @return loglikelihood (one per response)
     #
-    def _neg_llik(self, params, x, y):
-        eta = self._get_eta(params, x)
-        mu = self._rev_link(eta)
-        llik = np.sum((norm.logpdf(y, mu)))
-        return -llik
+    def _gaussian_llf(self, n, deviance, scale):
+        return -n / 2 * np.log(2 * np.pi * scale) - deviance / (2 * scale)
 
     ## Prints results of model estimation
     #
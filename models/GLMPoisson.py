@@ -2,15 +2,18 @@
 #  This module defines a subclass for Poisson GLM
 #
 import numpy as np
-from scipy.stats import poisson
+from scipy.special import gammaln, xlogy
 from models.GLMBase import GLMBase
 
 ## A subclass that is used to build a Poisson GLM
 #
 class GLMPoisson(GLMBase):
+    # The canonical link, which is recorded in saved models
+    _link_name = 'log'
+
     ## Constructs the Poisson GLM subclasss
     #  @param x a matrix of exogenous variables with the next format: [p, N]
-    #  @param y a matrix of endogenous variables with the next format: [p, N]
+    #  @param y a matrix of endogenous variables with the next format: [k, N], where k is the number of responses
     #  @param const a boolean that tells whether the interception point is used
     #
     def __init__(self, x, y, const):
@@ -18,22 +21,59 @@ class GLMPoisson(GLMBase):
     
     ## Defines a reverse model's link function
     #  @param eta matrix multiplication product for betas and Xs
+    #  @param out optional preallocated array to store mus in (it may be eta itself)
     #  @return matrix of mus calculated by this function
     #
-    def _rev_link(self, eta):
-        return np.exp(eta)
+    def _rev_link(self, eta, out = None):
+        return np.exp(eta, out=out)
+
+    ## Defines a model's link function
+    #  @param mu matrix of mus
+    #  @return matrix of etas calculated by this function
+    #
+    def _link(self, mu):
+        return np.log(mu)
+
+    ## Defines a model's variance function
+    #  @param mu matrix of mus
+    #  @return matrix of variances evaluated at mu
+    #
+    def _variance(self, mu):
+        return mu
+
+    ## Defines the part of loglikelihood that depends only on Ys: -log(y!)
+    #  @param y vector of Ys
+    #  @return constant term of loglikelihood
+    #
+    def _y_const(self, y):
+        return -np.sum(gammaln(y + 1), axis=0)
+
+    ## Defines a model's unit deviance: 2 * (y * log(y / mu) - (y - mu))
+    #  @param y matrix with Ys
+    #  @param mu matrix of mus
+    #  @return matrix with the deviance of every observation
+    #
+    def _unit_deviance(self, y, mu):
+        return 2 * (xlogy(y, y) - xlogy(y, mu) - (y - mu))
+
+    ## Evaluates loglikelihood directly from eta: y * eta - exp(eta) - log(y!)
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @return loglikelihood (one per response)
+    #
+    def _llik(self, eta, y, const):
+        return self._kernel(eta, y, const)[0]
 
-    ## Evaluates negative loglikelihood for the given model.
-    #  @param params matrix with betas
-    #  @param x matrix with Xs used for training
-    #  @param y matrix with Ys used for training
-    #  @return negative loglikelihood for given inputs
+    ## Evaluates loglikelihood and mus in a single pass, sharing exp(eta) between them
+    #  @param eta vector (or [N, k] matrix) with etas
+    #  @param y vector (or [N, k] matrix) with Ys
+    #  @param const constant term returned by _y_const
+    #  @return tuple with loglikelihood (one per response) and mus
     #
-    def _neg_llik(self, params, x, y):
-        eta = self._get_eta(params, x)
-        mu = self._rev_link(eta)
-        llik = np.sum((poisson.logpmf(y, mu)))
-        return -llik
+    def _kernel(self, eta, y, const):
+        mu = np.exp(eta, out=self._buffer('mu', eta.shape))
+        return const + np.einsum('n...,n...->...', y, eta) - np.sum(mu, axis=0), mu
 
     ## Prints results of model estimation
     #
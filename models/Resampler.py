@@ -0,0 +1,163 @@
+##
+#  This module defines the Resampler class
+#
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from loaders.Splitter import Splitter
+
+# Data and settings of the resampler that owns the current worker process. They are sent to every
+# process once by the pool initializer instead of being pickled with every task
+_worker_state = None
+
+## Stores the resampler's data inside a worker process
+#  @param state dictionary with the model class, data and fit settings
+#
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+## Fits a batch of replicates inside a worker process
+#  @param tasks list of tuples with indices of training and testing observations (testing ones may be None)
+#  @return list of tuples with betas and out-of-sample deviance of every replicate
+#
+def _run_worker(tasks):
+    return _run(_worker_state, tasks)
+
+## Fits a batch of replicates. Every replicate is warm-started from the full-data estimate,
+#  so IRLS usually needs only a couple of iterations
+#  @param state dictionary with the model class, data and fit settings
+#  @param tasks list of tuples with indices of training and testing observations (testing ones may be None)
+#  @return list of tuples with betas and out-of-sample deviance of every replicate (None if a fit fails, does not converge
+#  or its training data is separated)
+#
+def _run(state, tasks):
+    x, y = state['x'], state['y']
+    results = []
+    for train, test in tasks:
+        try:
+            glm = state['model'](Splitter.take(x, train), Splitter.take(y, train), state['const'])
+            params = glm.fit(init_param=state['init_param'], method=state['method'], tol=state['tol'], max_iter=state['max_iter'])
+            # Optimizers report convergence on separated data once loglikelihood stops changing, while betas diverge
+            if (not np.all(glm.diagnostics['converged']) or np.any(glm.separated())):
+                results.append(None)
+                continue
+            deviance = None if test is None else glm.deviance(Splitter.take(x, test), Splitter.take(y, test))
+            results.append((params, deviance))
+        except Exception:
+            # e.g. a bootstrap sample with a singular design
+            results.append(None)
+    return results
+
+## This class resamples a dataset and refits a GLM on every replicate: K-fold cross-validation
+#  and nonparametric bootstrap. Replicates are warm-started from the full-data estimate and
+#  spread over a process or a thread pool
+#
+class Resampler:
+    ## Constructs the Resampler object
+    #  @param model a GLM subclass, e.g. GLMBernoulli
+    #  @param x a matrix of exogenous variables with the next format: [p, N]
+    #  @param y a matrix of endogenous variables with the next format: [k, N]
+    #  @param const a boolean that tells whether the interception point is used
+    #  @param method an estimation method passed to fit(). Default value is irls
+    #  @param tol tolerance for termination passed to fit()
+    #  @param max_iter maximum number of iterations passed to fit()
+    #  @param workers the number of workers. 1 fits replicates in the current process. By default it equals the number of CPUs
+    #  @param executor 'process' or 'thread' - the kind of pool used when workers > 1
+    #
+    def __init__(self, model, x, y, const, method = 'irls', tol = None, max_iter = None, workers = None, executor = 'process'):
+        assert (isinstance(x, np.ndarray) or hasattr(x, 'tocsc')) and isinstance(y, np.ndarray), 'Input data should be numpy arrays'
+        assert x.shape[1] == y.shape[1], 'Matrices have different numbers of observations'
+        if (executor not in ('process', 'thread')):
+            raise Exception(f'Unknown executor: {executor}. Expected process or thread')
+        self._model = model
+        self._x = x
+        self._y = y
+        self._const = const
+        self._method = method
+        self._tol = tol
+        self._max_iter = max_iter
+        self._workers = (os.cpu_count() or 1) if workers is None else workers
+        self._executor = executor
+        self._full = None
+
+    ## Fits the model to the whole dataset. The estimate is computed once and used as a warm start of every replicate
+    #  @return fitted model
+    #
+    @property
+    def full_model(self):
+        if (self._full is None):
+            self._full = self._model(self._x, self._y, self._const)
+            self._full.fit(method=self._method, tol=self._tol, max_iter=self._max_iter)
+        return self._full
+
+    ## Fits all replicates, in batches so that every worker receives only a few tasks
+    #  @param tasks list of tuples with indices of training and testing observations
+    #  @return list of tuples with betas and out-of-sample deviance (None for failed fits)
+    #
+    def _map(self, tasks):
+        state = {
+            'model': self._model, 'x': self._x, 'y': self._y, 'const': self._const,
+            'init_param': self.full_model.params, 'method': self._method, 'tol': self._tol, 'max_iter': self._max_iter,
+        }
+        workers = min(self._workers, len(tasks))
+        if (workers <= 1):
+            return _run(state, tasks)
+
+        batches = [ list(batch) for batch in np.array_split(np.arange(len(tasks)), 4 * workers) if len(batch) > 0 ]
+        batches = [ [ tasks[i] for i in batch ] for batch in batches ]
+        if (self._executor == 'thread'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(lambda batch: _run(state, batch), batches)
+                return [ result for batch in results for result in batch ]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as pool:
+            return [ result for batch in pool.map(_run_worker, batches) for result in batch ]
+
+    ## Estimates out-of-sample deviance by K-fold cross-validation
+    #  @param n_splits the number of folds
+    #  @param random_state a seed that makes shuffling reproducible
+    #  @param shuffle a boolean that tells whether data is shuffled before splitting
+    #  @return dictionary with deviance of every fold, total deviance, deviance per observation,
+    #  betas of every fold and the number of failed fits
+    #
+    def cross_validate(self, n_splits = 5, random_state = None, shuffle = True):
+        n = self._x.shape[1]
+        tasks = list(Splitter(n, shuffle, random_state).kfold(n_splits))
+        results = self._map(tasks)
+        fits = [ (result, len(np.arange(n)[test])) for (_, test), result in zip(tasks, results) if result is not None ]
+        assert len(fits) > 0, 'All folds failed to fit'
+
+        fold_deviance = np.array([ result[1] for result, _ in fits ])
+        return {
+            'fold_deviance': fold_deviance,
+            'deviance': np.sum(fold_deviance, axis=0),
+            'mean_deviance': np.sum(fold_deviance, axis=0) / sum(size for _, size in fits),
+            'params': np.stack([ result[0] for result, _ in fits ]),
+            'n_failed': len(results) - len(fits),
+        }
+
+    ## Estimates the sampling distribution of betas by nonparametric bootstrap (resampling observations with replacement)
+    #  @param n_boot the number of bootstrap replicates
+    #  @param random_state a seed that makes resampling reproducible
+    #  @return dictionary with the full-data betas, betas of every replicate, bootstrap standard errors,
+    #  percentile confidence intervals (95%) and the number of failed fits
+    #
+    def bootstrap(self, n_boot = 1000, random_state = None):
+        assert n_boot > 1, 'At least 2 bootstrap replicates are required'
+        n = self._x.shape[1]
+        rng = np.random.RandomState(random_state)
+        # Sorted indices make gathering columns of [p, N] matrices cache friendly
+        tasks = [ (np.sort(rng.randint(0, n, n)), None) for _ in range(n_boot) ]
+        fits = [ result for result in self._map(tasks) if result is not None ]
+        assert len(fits) > 1, 'Less than 2 bootstrap replicates were fit successfully'
+
+        params = np.stack([ result[0] for result in fits ])
+        return {
+            'params': self.full_model.params,
+            'replicates': params,
+            'std_err': np.std(params, axis=0, ddof=1),
+            'conf_int': np.percentile(params, [ 2.5, 97.5 ], axis=0),
+            'n_failed': n_boot - len(fits),
+        }
@@ -0,0 +1,196 @@
+##
+#  This module defines the ShardPool class
+#
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shards attached by the current worker process and GLMs built on them. A GLM keeps its Ys,
+# so the terms of loglikelihood that depend only on Ys are computed once per shard
+_attached = {}
+_models = {}
+
+## Limits BLAS inside a worker process to a single thread, so that workers do not compete for cores.
+#  threadpoolctl is optional: without it BLAS keeps its own settings
+#
+def _init_worker():
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+## Returns a GLM built on read-only views of a shard inside a worker process
+#  @param shard dictionary with the model class, const and descriptors (name, shape, dtype) of Xs and Ys
+#  @return GLM whose x and y are the shard
+#
+def _shard_model(shard):
+    key = shard['x'][0]
+    if (key not in _models):
+        arrays = []
+        for name, shape, dtype in (shard['x'], shard['y']):
+            _attached[name] = shared_memory.SharedMemory(name=name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[name].buf)
+            array.flags.writeable = False
+            arrays.append(array)
+        _models[key] = shard['model'](arrays[0], arrays[1], shard['const'])
+    return _models[key]
+
+## Evaluates a shard's part of the objective inside a worker process
+#  @param shard dictionary with the model class, const and descriptors of Xs and Ys
+#  @param task 'grad' (negative loglikelihood and its gradient), 'fisher' (Fisher information)
+#  or 'stats' (negative loglikelihood and IRLS sufficient statistics XWX' and XWz)
+#  @param params [p] vector with betas or None (for 'stats' only) to start from mus given by _init_mu
+#  @return partial results of the shard
+#
+def _evaluate(shard, task, params):
+    glm = _shard_model(shard)
+    x = glm._x
+    y, const = glm._prepare(glm._y)
+    if (task == 'grad'):
+        return glm._neg_llik_grad(params, x, glm._y)
+    if (task == 'fisher'):
+        return glm._fisher(params, x, glm._y)
+    if (params is None):
+        mu = glm._init_mu(y)
+        eta = glm._link(mu)
+        neg_llik = np.inf
+    else:
+        eta = glm._get_eta(params, x)
+        neg_llik, mu = glm._kernel(eta, y, const)
+        neg_llik, mu = -neg_llik, mu.copy()
+    w = np.maximum(glm._variance(mu), np.finfo(float).eps)
+    z = eta + (y - mu) / w
+    return neg_llik, glm._gram(x, w), x @ (w * z)
+
+## This class splits a dataset by observations into shards kept in shared memory and evaluates
+#  the loglikelihood, its gradient and the Fisher information of a GLM in a pool of worker processes.
+#  Workers return partial sums of their shards and the pool adds them up. Every shard is pinned to one
+#  worker, so a worker attaches and prepares only its own shards, and the pool can be reused by later fits
+#
+class ShardPool:
+    ## Constructs the ShardPool object. Every shard is copied into shared memory once
+    #  @param model a GLM subclass, e.g. GLMPoisson
+    #  @param x a dense matrix of exogenous variables with the next format: [p, N]
+    #  @param y a matrix with a single response: [1, N] or [N]
+    #  @param const a boolean that tells whether the interception point is used
+    #  @param workers the number of worker processes. By default it equals the number of CPUs
+    #  @param n_shards the number of shards. By default it equals the number of workers
+    #
+    def __init__(self, model, x, y, const, workers = None, n_shards = None):
+        assert isinstance(x, np.ndarray) and isinstance(y, np.ndarray), 'Sharding supports dense numpy arrays only'
+        y = y.reshape(1, -1) if y.ndim == 1 else y
+        assert y.shape[0] == 1, 'Sharding supports a single response'
+        assert x.shape[1] == y.shape[1], 'Matrices have different numbers of observations'
+        self._workers = (os.cpu_count() or 1) if workers is None else workers
+        n_shards = self._workers if n_shards is None else n_shards
+        assert 0 < n_shards <= x.shape[1], f'n_shards should be between 1 and the number of observations. Got: {n_shards}'
+        # The source of the shards, so that a model reuses the pool only as long as its data stays the same
+        self._source = (model, x, y, const)
+        self._blocks = []
+        self._shards = []
+        # A single-process executor per worker: shard i is always evaluated by worker i % workers
+        self._pools = []
+        # Workers and shared memory are released even if the pool is not closed explicitly
+        self._finalizer = weakref.finalize(self, ShardPool._release, self._pools, self._blocks)
+        try:
+            bounds = np.linspace(0, x.shape[1], n_shards + 1).astype(int)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                # Every shard is a contiguous [p, n] block, so workers read it sequentially
+                self._shards.append({ 'model': model, 'const': const,
+                                      'x': self._share(x[:, start:stop]), 'y': self._share(y[:, start:stop]) })
+            self._pools.extend(ProcessPoolExecutor(max_workers=1, initializer=_init_worker) for _ in range(min(self._workers, n_shards)))
+        except Exception:
+            self.close()
+            raise
+
+    ## Tells whether the pool holds shards of the given data
+    #  @param model a GLM subclass
+    #  @param x the matrix of exogenous variables
+    #  @param y the matrix of endogenous variables
+    #  @param const a boolean that tells whether the interception point is used
+    #  @param workers the number of worker processes
+    #  @return True if the pool can be reused for the data
+    #
+    def matches(self, model, x, y, const, workers):
+        source = self._source
+        return len(self._pools) > 0 and source[0] is model and source[1] is x and source[2] is y and source[3] == const and self._workers == workers
+
+    ## Copies an array into a new shared memory block owned by the pool
+    #  @param array numpy array
+    #  @return picklable descriptor (name, shape, dtype)
+    #
+    def _share(self, array):
+        array = np.ascontiguousarray(array, dtype=float)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        return (block.name, array.shape, array.dtype.str)
+
+    ## Sends the same task with betas to every shard and adds up the partial results
+    #  @param task 'grad', 'fisher' or 'stats'
+    #  @param params [p] vector with betas or None
+    #  @return tuple with sums of the partial results (or a single array for 'fisher')
+    #
+    def _reduce(self, task, params):
+        assert len(self._pools) > 0, 'ShardPool has been closed'
+        futures = [ self._pools[i % len(self._pools)].submit(_evaluate, shard, task, params) for i, shard in enumerate(self._shards) ]
+        parts = [ future.result() for future in futures ]
+        if (task == 'fisher'):
+            return np.sum(parts, axis=0)
+        return tuple(np.sum([ part[i] for part in parts ], axis=0) for i in range(len(parts[0])))
+
+    ## Evaluates negative loglikelihood and its gradient over all shards
+    #  @param params [p] vector with betas
+    #  @return tuple with negative loglikelihood and its gradient
+    #
+    def neg_llik_grad(self, params):
+        neg_llik, grad = self._reduce('grad', params)
+        return float(neg_llik), grad
+
+    ## Evaluates the Fisher information over all shards
+    #  @param params [p] vector with betas
+    #  @return [p, p] matrix with the Fisher information
+    #
+    def fisher(self, params):
+        return self._reduce('fisher', params)
+
+    ## Evaluates negative loglikelihood and IRLS sufficient statistics over all shards
+    #  @param params [p] vector with betas or None to start from mus given by _init_mu
+    #  @return tuple with negative loglikelihood, XWX' and XWz
+    #
+    def irls_stats(self, params):
+        return self._reduce('stats', params)
+
+    ## Stops the workers and frees the shared memory
+    #
+    def close(self):
+        self._finalizer()
+
+    ## Stops executors and frees shared memory blocks. It does not refer to the pool, so it can run as its finalizer
+    #  @param pools list of executors, emptied in place
+    #  @param blocks list of shared memory blocks, emptied in place
+    #
+    @staticmethod
+    def _release(pools, blocks):
+        for pool in pools:
+            pool.shutdown()
+        for block in blocks:
+            block.close()
+            block.unlink()
+        pools.clear()
+        blocks.clear()
+
+    ## Allows to use the pool in a with statement
+    #  @return the pool itself
+    #
+    def __enter__(self):
+        return self
+
+    ## Closes the pool at the end of a with statement
+    #
+    def __exit__(self, *args):
+        self.close()
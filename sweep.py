@@ -0,0 +1,238 @@
+##
+#  This module runs sweeps of experiments over datasets x models x predictor subsets.
+#  Every dataset is loaded once and its matrices are placed in shared memory, so worker processes
+#  that fit the models read them without pickling. Datasets are loaded concurrently and their
+#  configurations start fitting as soon as they are ready.
+#
+import asyncio
+import contextlib
+import csv
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from map_dicts import dataset_map, model_map
+
+# Shared memory blocks attached by the current worker process
+_attached = {}
+
+## Builds the default grid: every dataset, every model and every non-empty subset of predictors
+#  @param datasets names of datasets. By default all datasets from dataset_map are used
+#  @param models names of models. By default all models from model_map are used
+#  @return list of configurations: dictionaries with dset, model and predictors (e.g. [ 'x1', 'x3' ])
+#
+def default_grid(datasets = None, models = None):
+    grid = []
+    for dset in datasets or list(dataset_map):
+        n = len(dataset_map[dset]['x_names'])
+        subsets = [ subset for size in range(1, n + 1) for subset in itertools.combinations(range(n), size) ]
+        for model in models or list(model_map):
+            grid.extend({ 'dset': dset, 'model': model, 'predictors': [ f'x{i + 1}' for i in subset ] } for subset in subsets)
+    return grid
+
+## Reads a user-given grid from a JSON file with a list of configurations,
+#  e.g. [ { "dset": "spector", "model": "bernoulli", "predictors": [ "x1", "x3" ] } ]
+#  @param path path to the JSON file
+#  @return list of configurations
+#
+def read_grid(path):
+    with open(path) as f:
+        grid = json.load(f)
+    for config in grid:
+        assert config.get('dset') in dataset_map, f'Unknown dataset in the grid: {config.get("dset")}'
+        assert config.get('model') in model_map, f'Unknown model in the grid: {config.get("model")}'
+        n = len(dataset_map[config['dset']]['x_names'])
+        assert all(len(p) == 2 and p[1].isnumeric() and 1 <= int(p[1]) <= n for p in config.get('predictors', [])), \
+            f'Invalid predictors in the grid: {config.get("predictors")}'
+    return grid
+
+## Copies an array into a new shared memory block
+#  @param array numpy array
+#  @param dtype dtype of the shared copy
+#  @return tuple with the block and a picklable descriptor (name, shape, dtype)
+#
+def _share(array, dtype = float):
+    array = np.ascontiguousarray(array, dtype=dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+## Returns a read-only view of a shared array inside a worker process
+#  @param descriptor tuple (name, shape, dtype) returned by _share
+#  @return numpy array backed by shared memory
+#
+def _attach(descriptor):
+    name, shape, dtype = descriptor
+    if (name not in _attached):
+        # Workers share the resource tracker of the parent process, which owns and unlinks the block
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[name].buf)
+    array.flags.writeable = False
+    return array
+
+## Prepares a worker process. fit() imports scipy.optimize on first use and the import is slow,
+#  so it is done here rather than inside the timed fit of the first configuration of every worker
+#  @param fit_method an estimation method passed to fit()
+#
+def _init_worker(fit_method):
+    if (fit_method != 'irls'):
+        import scipy.optimize
+
+## Fits a single configuration. This function runs inside worker processes
+#  @param task dictionary with the configuration and descriptors of shared matrices
+#  @return dictionary with the results
+#
+def _run_task(task):
+    x, y = _attach(task['x']), _attach(task['y'])
+    train, test = _attach(task['train']), _attach(task['test'])
+    # Only the selected predictors and observations are gathered from shared memory
+    x_train, x_test = x[np.ix_(task['rows'], train)], x[np.ix_(task['rows'], test)]
+    y_train = y[:, train]
+
+    row = { 'dset': task['dset'], 'model': task['model'], 'predictors': ' '.join(task['predictors']), 'intercept': task['intercept'] }
+    try:
+        model = model_map[task['model']]
+        glm = model['model'](x_train, y_train, task['intercept'])
+        start = time.perf_counter()
+        glm.fit(method=task['fit_method'])
+        row['fit_time'] = time.perf_counter() - start
+        row['n_iter'] = glm.diagnostics['n_iter']
+        row['converged'] = glm.diagnostics['converged']
+        row['params'] = [ float(value) for value in glm.params ]
+
+        if (task['compare']):
+            import statsmodels.api as sm
+            res = sm.GLM(y_train.T, x_train.T, family=model['reference']).fit()
+            row['sm_params'] = [ float(value) for value in res.params ]
+            row['params_match'] = bool(np.allclose(glm.params, res.params, atol=task['moe']))
+            row['predictions_match'] = bool(np.allclose(glm.predict(x_test), res.predict(x_test.T), atol=task['moe']))
+    except Exception as e:
+        row['error'] = str(e)
+    return row
+
+## Builds the tasks of a loaded dataset and places its matrices in shared memory
+#  @param dset the name of the dataset
+#  @param loader the loaded dataset with all predictors
+#  @param configs configurations of the dataset
+#  @param loading AsyncLoader used to load designs of predictor subsets
+#  @param blocks list that collects created shared memory blocks
+#  @param settings dictionary with add_intercept, test_size, random_state, fit_method, compare and moe
+#  @return list of tasks
+#
+async def _dataset_tasks(dset, loader, configs, loading, blocks, settings):
+    from loaders.Splitter import Splitter
+    dataset, add_intercept = dataset_map[dset], settings['add_intercept']
+    # The same split is shared by all configurations of the dataset
+    n = loader.x.shape[1]
+    if (isinstance(settings['test_size'], float) and 0 < settings['test_size'] < 1):
+        train, test = Splitter(n, True, settings['random_state']).holdout(settings['test_size'])
+    else:
+        train = test = np.arange(n)
+    shared = [ _share(loader.y), _share(train, np.intp), _share(test, np.intp) ]
+    blocks.extend(block for block, _ in shared)
+    designs = {}
+    if (len(loader.levels) == 0):
+        shared.append(_share(loader.x))
+        blocks.append(shared[-1][0])
+    else:
+        # Which levels of a categorical column are dropped depends on the other predictors,
+        # so a design is built for every subset of predictors (columns come from the column cache)
+        for config in configs:
+            key = tuple(config['predictors'])
+            if (key not in designs):
+                x_names = [ dataset['x_names'][int(p[1]) - 1] for p in key ]
+                subset = await loading.load(type(loader), x_names, dataset['y_names'], dataset['name'], const=add_intercept)
+                designs[key] = len(shared)
+                shared.append(_share(subset.x))
+                blocks.append(shared[-1][0])
+    y_desc, train_desc, test_desc = [ desc for _, desc in shared[:3] ]
+
+    tasks = []
+    for config in configs:
+        if (len(designs) == 0):
+            x_desc = shared[3][1]
+            rows = ([ 0 ] if add_intercept else []) + [ int(p[1]) - 1 + int(add_intercept) for p in config['predictors'] ]
+        else:
+            x_desc = shared[designs[tuple(config['predictors'])]][1]
+            rows = list(range(x_desc[1][0]))
+        tasks.append({
+            'dset': dset, 'model': config['model'], 'predictors': config['predictors'], 'intercept': add_intercept,
+            'x': x_desc, 'y': y_desc, 'rows': rows, 'train': train_desc, 'test': test_desc,
+            'fit_method': settings['fit_method'], 'compare': settings['compare'], 'moe': settings['moe'],
+        })
+    return tasks
+
+## Loads all datasets of the grid concurrently and submits the configurations of every dataset to
+#  the process pool as soon as that dataset is ready, so fitting overlaps with loading of the others
+#  @param grid list of configurations
+#  @param workers the number of worker processes
+#  @param settings dictionary with add_intercept, test_size, random_state, fit_method, compare and moe
+#  @return list of dictionaries with results
+#
+async def _run_async(grid, workers, settings):
+    from loaders.AsyncLoader import AsyncLoader
+    loop = asyncio.get_running_loop()
+    dsets = list(dict.fromkeys(config['dset'] for config in grid))
+    results, blocks = { dset: [] for dset in dsets }, []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings['fit_method'],)) as pool, AsyncLoader() as loading:
+            # The first task forks all workers, so they are created before any loader thread is started.
+            # The resource tracker is started first, so that workers share it and do not unlink the blocks on exit
+            resource_tracker.ensure_running()
+            await loop.run_in_executor(pool, int)
+            # Every dataset is loaded once with all predictors, configurations select rows of X
+            async for dset, loader in loading.load_datasets({ dset: dataset_map[dset] for dset in dsets }, const=settings['add_intercept']):
+                configs = [ config for config in grid if config['dset'] == dset ]
+                if (isinstance(loader, Exception)):
+                    print(f'Skipping dataset {dset}: {loader}', file=sys.stderr)
+                    results[dset] = [ { 'dset': dset, 'model': config['model'], 'predictors': ' '.join(config['predictors']),
+                                        'intercept': settings['add_intercept'], 'error': str(loader) } for config in configs ]
+                    continue
+                tasks = await _dataset_tasks(dset, loader, configs, loading, blocks, settings)
+                results[dset] = [ loop.run_in_executor(pool, _run_task, task) for task in tasks ]
+            # Results keep the order of datasets in the grid, whatever order they were loaded in
+            return [ row if isinstance(row, dict) else await row for dset in dsets for row in results[dset] ]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+## Runs all configurations of the grid in a process pool. Datasets are loaded concurrently and
+#  configurations of a dataset start fitting as soon as it has been loaded
+#  @param grid list of configurations
+#  @param add_intercept a boolean that tells whether an intercept is used
+#  @param test_size a fraction of the dataset used for testing
+#  @param random_state a random state of the train-test split
+#  @param fit_method an estimation method passed to fit()
+#  @param compare a boolean that tells whether results are compared with statsmodels
+#  @param workers the number of worker processes. By default it equals the number of CPUs
+#  @param moe margin of error used to compare results with statsmodels
+#  @return list of dictionaries with results
+#
+def run(grid, add_intercept = False, test_size = 0.3, random_state = 0, fit_method = 'BFGS', compare = True, workers = None, moe = 1e-5):
+    settings = { 'add_intercept': add_intercept, 'test_size': test_size, 'random_state': random_state,
+                 'fit_method': fit_method, 'compare': compare, 'moe': moe }
+    # Messages of loaders go to stderr, so they are not mixed with the results
+    with contextlib.redirect_stdout(sys.stderr):
+        return asyncio.run(_run_async(grid, workers, settings))
+
+## Writes results as a machine-readable table
+#  @param results list of dictionaries with results
+#  @param file an open text file
+#  @param fmt 'csv' or 'json'
+#
+def write(results, file, fmt = 'csv'):
+    if (fmt == 'json'):
+        json.dump(results, file, indent=2)
+        file.write('\n')
+        return
+    columns = list(dict.fromkeys(key for row in results for key in row))
+    writer = csv.DictWriter(file, fieldnames=columns)
+    writer.writeheader()
+    for row in results:
+        writer.writerow({ key: json.dumps(value) if isinstance(value, list) else value for key, value in row.items() })
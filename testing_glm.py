@@ -1,9 +1,8 @@
-import numpy as np
-import statsmodels.api as sm
 import argparse
 
 # I saved mapping dictionaries in a separate file to preserve space in this code.
 # If you want to see all my model names and other details, you can find them in map_dicts.py
+# Loaders, models and statsmodels are imported lazily, only when they are selected, so that startup stays fast
 from map_dicts import model_map, dataset_map
 
 parser = argparse.ArgumentParser(
@@ -25,23 +24,61 @@ so a margin of error (1e-5) is used to compare them to check if they are approxi
 '''
 )
 
-parser.add_argument('-d', '--dset', default='duncan', choices=[ 'duncan', 'spector', 'warpbreaks' ], help='you can choose one of the following datasets: duncan, spector, warpbreaks')
-parser.add_argument('-m', '--model', default='normal', choices=[ 'normal', 'bernoulli', 'poisson' ], help='you can choose one of the following GLMs: normal, bernoulli, poisson')
+parser.add_argument('-d', '--dset', default='duncan', choices=list(dataset_map), help='you can choose one of the following datasets: duncan, spector, warpbreaks')
+parser.add_argument('-m', '--model', default='normal', choices=list(model_map), help='you can choose one of the following GLMs: normal, bernoulli, poisson')
 parser.add_argument('-p', '--predictors', default=[ 'x1' ], nargs='+', help='specify between 1 and 3 predictor variables (e.g. -p x1 x3)')
 parser.add_argument('-ts', '--test-size', type=float, default=0.3, help='set a fraction of the dataset between 0 and 1 that will be used for testing')
 parser.add_argument('-rs', '--random-state', type=int, default=0, help='set a random state between 0 and 1000 for a train-test split')
 parser.add_argument('-ai', '--add-intercept', action='store_true', help='specify whether to include an intercept in the model estimation')
-parser.add_argument('-ps', '--print-summary', action='store_true', help='indicate whether to print model summaries or not')
+parser.add_argument('-fm', '--fit-method', default='BFGS', help='choose an estimation method: irls or any optimizer of scipy\'s minimize (e.g. BFGS, Newton-CG, trust-ncg)')
+parser.add_argument('-dt', '--dtype', default=None, choices=[ 'float32', 'float64' ], help='choose a dtype of loaded data. By default dtypes of the dataset are kept')
+parser.add_argument('-sp', '--sparse', action='store_true', help='store X as a scipy.sparse matrix (useful for categorical predictors with many levels)')
+parser.add_argument('-nc', '--no-cache', action='store_true', help='parse the dataset from its source instead of the on-disk column cache')
+parser.add_argument('-off', '--offline', action='store_true', help='use only previously downloaded copies of online datasets')
+parser.add_argument('-nfc', '--no-fit-cache', action='store_true', help='fit the models instead of reusing results cached by previous runs with the same data and settings')
+parser.add_argument('-vfc', '--verify-fit-cache', action='store_true', help='fit the models and check that cached results are the same (a stale entry is replaced)')
+parser.add_argument('-sc', '--skip-comparison', action='store_true', help='do not fit a statsmodels\' GLM for comparison (statsmodels is not imported then)')
+parser.add_argument('-sw', '--sweep', action='store_true', help='run every dataset x model x predictor subset (or the configurations from --grid) in parallel and print a table of results')
+parser.add_argument('-g', '--grid', default=None, help='JSON file with a list of configurations for --sweep, e.g. [ { "dset": "spector", "model": "bernoulli", "predictors": [ "x1", "x3" ] } ]')
+parser.add_argument('-w', '--workers', type=int, default=None, help='the number of worker processes used by --sweep, --cv-folds and --bootstrap. By default it equals the number of CPUs')
+parser.add_argument('-o', '--output', default=None, help='file where --sweep saves its results. By default they are printed')
+parser.add_argument('-f', '--format', default='csv', choices=[ 'csv', 'json' ], help='format of --sweep results')
+parser.add_argument('-cv', '--cv-folds', type=int, default=None, help='estimate out-of-sample deviance of the model by K-fold cross-validation on the whole dataset')
+parser.add_argument('-bs', '--bootstrap', type=int, default=None, help='estimate bootstrap standard errors of betas with the given number of replicates')
+parser.add_argument('-tm', '--telemetry', action='store_true', help='instrument the fit and print iterations, likelihood evaluations and where the time went')
+parser.add_argument('-ps', '--print-summary', action='store_true', help='indicate whether to print model summaries (standard errors, p-values, deviance, AIC, ...) or not')
 
 args = parser.parse_args()
 
-# Here I want to convert a list of predictors [ x1, x3 ] to indices of columns -> [ 0, 2 ] and filter incorrect values
-args.predictors = [ int(i[1]) - 1 for i in args.predictors if (len(i) == 2 and i[1].isnumeric()) ]
+import numpy as np
 
 # Here I am also filtering improper values for test_size and random_state
 if (args.test_size < 0 or args.test_size > 1): raise Exception(f'--test-size should be between 0 and 1. Got: {args.test_size}')
 if (args.random_state < 0 or args.random_state > 1000): raise Exception(f'--random-state should be between 0 and 1000. Got: {args.random_state}')
 
+if (args.no_cache):
+    from loaders.CSVLoader import CSVLoader
+    CSVLoader._cachedir = None
+if (args.offline):
+    from loaders.CSVScraper import CSVScraper
+    CSVScraper._offline = True
+
+# In the sweep mode each dataset is loaded once and all configurations are fit in a process pool
+if (args.sweep):
+    import sys
+    import sweep
+    grid = sweep.default_grid() if args.grid is None else sweep.read_grid(args.grid)
+    results = sweep.run(grid, args.add_intercept, args.test_size, args.random_state, args.fit_method, not args.skip_comparison, args.workers)
+    if (args.output is None):
+        sweep.write(results, sys.stdout, args.format)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            sweep.write(results, f, args.format)
+    raise SystemExit
+
+# Here I want to convert a list of predictors [ x1, x3 ] to indices of columns -> [ 0, 2 ] and filter incorrect values
+args.predictors = [ int(i[1]) - 1 for i in args.predictors if (len(i) == 2 and i[1].isnumeric()) ]
+
 # Here I am retrieving all infomation about a dataset selected by user and trying to filter bad predictors (e.g. x4 since we don't have 4th column)
 dataset = dataset_map[args.dset]
 if (max(args.predictors) >= len(dataset['x_names']) or min(args.predictors) < 0 or len(args.predictors) == 0):
@@ -49,33 +86,101 @@ if (max(args.predictors) >= len(dataset['x_names']) or min(args.predictors) < 0
 
 x_names = np.array(dataset['x_names'])[args.predictors]
 
+
 # A great example of polymorphism since I do not know the exact type of CSVLoader but still I can use it
-loader = dataset['loader'](x_names, dataset['y_names'], dataset['name'])
-if (args.add_intercept): loader.add_constant()
+# The intercept row is filled while loading, so X is not copied once more by add_constant()
+loader = dataset['loader'](x_names, dataset['y_names'], dataset['name'], dtype=args.dtype, const=args.add_intercept, sparse=args.sparse)
 
 x_train, x_test, y_train, y_test = loader.test_train_split(args.test_size, args.random_state)
 
+# Fit results are cached by a hash of the split data and the fit settings, so a repeated run skips fitting.
+# Telemetry describes an actual fit, so it bypasses the cache
+fit_cache, cached, reference = None, None, None
+if (not args.no_fit_cache and not args.telemetry):
+    from models.FitCache import FitCache
+    fit_cache = FitCache()
+    cache_key = FitCache.key([ x_train, y_train, x_test ], { 'model': args.model, 'intercept': args.add_intercept,
+                             'method': args.fit_method, 'tol': None, 'max_iter': None, 'solver': 'qr' })
+    cached = fit_cache.get(cache_key)
+
 # Another example of polymorphism since I do not know the exact type of GLModel but still I can use it
 model = model_map[args.model]
-glm = model['model'](x_train, y_train, args.add_intercept)
-glm.fit()
+if (cached is not None and not args.verify_fit_cache):
+    glm, reference = cached
+    print('Loaded the fit from the cache')
+else:
+    glm = model['model'](x_train, y_train, args.add_intercept)
+    if (args.telemetry): glm.instrument()
+    glm.fit(method=args.fit_method)
+    if (cached is not None):
+        same = np.array_equal(glm.params, cached[0].params) and glm.diagnostics['converged'] == cached[0].diagnostics['converged']
+        print(f'Fit cache verification: cached betas {"match" if same else "differ, so the entry is replaced"}')
+    if (fit_cache is not None):
+        fit_cache.put(cache_key, glm, None if cached is None else cached[1])
+if (args.telemetry):
+    telemetry, diagnostics = glm.telemetry, glm.diagnostics
+    print(f'Fit with {diagnostics["method"]} in {telemetry["fit_time"] * 1000:.2f} ms: {diagnostics["message"]} '
+          f'(iterations: {diagnostics["n_iter"]}, loglikelihood evaluations: {diagnostics["n_fev"]})')
+    print("\n".join([f'{category:>10}: {telemetry["calls"][category]:>5} calls | {seconds * 1000:>9.3f} ms' for category, seconds in telemetry['time'].items()]))
+    print("\n".join([f'iter {record["iter"]:>3}: neg_llik {record["neg_llik"]:>14.6f} | grad norm {record["grad_norm"]:>10.3e}' for record in telemetry['history']]))
 if (args.print_summary): glm.summary()
 
-# Fitting a statsmodels' GLM to compare the results
-sm_glm = sm.GLM(y_train.T, x_train.T, family=model['reference'])
-res = sm_glm.fit()
-if (args.print_summary): print(res.summary())
-
 glm_pred = glm.predict(x_test)
-sm_glm_pred = res.predict(x_test.T)
 
+# Replicates are warm-started from the full-data estimate and fit in a process pool
+if (args.cv_folds is not None or args.bootstrap is not None):
+    from models.Resampler import Resampler
+    resampler = Resampler(model['model'], loader.x, loader.y, args.add_intercept, workers=args.workers)
+    if (args.cv_folds is not None):
+        cv = resampler.cross_validate(args.cv_folds, args.random_state)
+        print(f'{args.cv_folds}-fold CV deviance: {cv["deviance"]:.6f} | per observation: {cv["mean_deviance"]:.6f} | failed folds: {cv["n_failed"]}')
+    if (args.bootstrap is not None):
+        boot = resampler.bootstrap(args.bootstrap, args.random_state)
+        print(f'Bootstrap with {args.bootstrap} replicates ({boot["n_failed"]} failed)')
+        print("\n".join([f'x{i + int(not args.add_intercept)}: {beta:>12.6f} | s.e. {se:>12.6f}' for i, (beta, se) in enumerate(zip(boot['params'], boot['std_err']))]))
+
+if (args.skip_comparison):
+    params_table = "\n".join([f'x{i + int(not args.add_intercept)}: {glm:>12.6f}' for i, glm in enumerate(glm.params)])
+    mus_table = "\n".join([f'{i + 1:>2}: {glm:>12.6f}' for i, glm in enumerate(glm_pred)])
+    print(f'''
+{"Model: " + args.model:>16} | Dset: {args.dset:<11}
+-------------------------------
+{params_table}
+-------------------------------
+Predictions:
+{mus_table}
+    ''')
+    raise SystemExit
+
+# Fitting a statsmodels' GLM to compare the results unless its output has been cached together with the fit
+if (reference is None or args.verify_fit_cache):
+    import statsmodels.api as sm
+
+    # statsmodels expects dense matrices
+    if (args.sparse):
+        x_train, x_test = x_train.toarray(), x_test.toarray()
+
+    # The reference is always statsmodels' own IRLS: statsmodels rejects e.g. Newton-CG and trust-ncg, and
+    # its BFGS stops about 4e-4 away from the optimum, so --fit-method is not passed to it
+    sm_glm = sm.GLM(y_train.T, x_train.T, family=model['reference'])
+    res = sm_glm.fit()
+    fresh = { 'params': res.params, 'bse': res.bse, 'predictions': res.predict(x_test.T), 'summary': str(res.summary()) }
+    if (reference is not None):
+        same = all(np.array_equal(reference[name], fresh[name]) for name in ('params', 'bse', 'predictions'))
+        print(f'Fit cache verification: cached statsmodels\' output {"matches" if same else "differs, so the entry is replaced"}')
+    reference = fresh
+    if (fit_cache is not None):
+        fit_cache.put(cache_key, glm, reference)
+if (args.print_summary): print(reference['summary'])
+
+sm_glm_pred = reference['predictions']
 # Setting a margin of error (MoE) to compare results since they are not exactly identical 
 moe = 1e-5
 
 # I added some nice formatting to compare the results from two modules
 # Basically this part iterates over two lists at the same time and fills rows of 
 # a comparison table. 
-params_comparison = "\n".join([f'x{i + int(not args.add_intercept)}: {glm:>12.6f} | {sm_glm:>12.6f}' for i, (glm, sm_glm) in enumerate(zip(glm.params, res.params))])
+params_comparison = "\n".join([f'x{i + int(not args.add_intercept)}: {glm:>12.6f} | {sm_glm:>12.6f}' for i, (glm, sm_glm) in enumerate(zip(glm.params, reference['params']))])
 params_summary = f'''
 {"Model: " + args.model:>16} | Dset: {args.dset:<11}
 -------------------------------
@@ -83,7 +188,8 @@ params_summary = f'''
 -------------------------------
 {params_comparison}
 -------------------------------
-Are betas identical with MoE of {moe}: {np.allclose(glm.params, res.params, atol=moe)}
+Are betas identical with MoE of {moe}: {np.allclose(glm.params, reference['params'], atol=moe)}
+Are standard errors identical with MoE of {moe}: {np.allclose(glm.bse, reference['bse'], atol=moe)}
     '''
 
 print(params_summary)
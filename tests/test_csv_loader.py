@@ -0,0 +1,32 @@
+##
+#  Tests of designs built by CSV loaders
+#
+import numpy as np
+import pytest
+
+from loaders.CSVLoader import CSVLoader
+from loaders.CSVReader import CSVReader
+
+## Writes a CSV file with categorical columns into a temporary datasets folder and disables the column cache
+#  @return the filename of the dataset
+#
+@pytest.fixture
+def dataset(tmp_path):
+    folder, cachedir = CSVReader._foldername, CSVLoader._cachedir
+    rows = [ f'{wool},{tension},{x},{breaks}' for wool, tension, x, breaks in
+        zip('ABABABABAB', 'LMHLMHLMHL', range(10), [ 26, 30, 54, 25, 70, 52, 51, 26, 67, 18 ]) ]
+    (tmp_path / 'breaks.csv').write_text('\n'.join([ 'wool,tension,x,breaks' ] + rows) + '\n')
+    CSVReader._foldername, CSVLoader._cachedir = str(tmp_path), None
+    yield 'breaks.csv'
+    CSVReader._foldername, CSVLoader._cachedir = folder, cachedir
+
+@pytest.mark.parametrize('sparse', [ False, True ])
+@pytest.mark.parametrize('x_names', [ [ 'wool', 'tension' ], [ 'x', 'tension', 'wool' ] ])
+def test_add_constant_matches_const_design(dataset, x_names, sparse):
+    loaded = CSVReader(x_names, [ 'breaks' ], dataset, const=True, sparse=sparse)
+    loader = CSVReader(x_names, [ 'breaks' ], dataset, sparse=sparse)
+    loader.add_constant()
+    x = loader.x.toarray() if sparse else loader.x
+    assert loader.feature_names == loaded.feature_names
+    assert np.array_equal(x, loaded.x.toarray() if sparse else loaded.x)
+    assert np.linalg.matrix_rank(x) == x.shape[0]
@@ -0,0 +1,131 @@
+##
+#  Tests of downloads of CSVScraper and HTTPCache against a local HTTP server
+#
+import functools
+import http.server
+import os
+import threading
+import urllib.error
+
+import numpy as np
+import pytest
+
+from loaders.CSVLoader import CSVLoader
+from loaders.CSVScraper import CSVScraper
+from loaders.HTTPCache import HTTPCache
+
+## A request handler that records the status of every response and does not log to stderr.
+#  It answers every request with the error code in error, unless it is None
+#
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    statuses = []
+    error = None
+
+    def do_GET(self):
+        if (_Handler.error is not None):
+            self.send_error(_Handler.error)
+            return
+        super().do_GET()
+
+    def send_response(self, code, message = None):
+        _Handler.statuses.append(code)
+        super().send_response(code, message)
+
+    def log_message(self, *args):
+        pass
+
+## Serves a folder with a CSV file over HTTP
+#  @return tuple with the url of the file, its path and the list of response statuses
+#
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / 'www'
+    root.mkdir()
+    path = root / 'data.csv'
+    path.write_text('x1,y\n1,2\n2,4\n3,6\n')
+    _Handler.statuses, _Handler.error = [], None
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/data.csv', path, _Handler.statuses
+    httpd.shutdown()
+    httpd.server_close()
+
+## Points the cache of loaders at a temporary folder (or disables it)
+#
+@pytest.fixture
+def cachedir(tmp_path, request):
+    previous = CSVLoader._cachedir
+    CSVLoader._cachedir = None if getattr(request, 'param', True) is None else str(tmp_path / 'cache')
+    yield CSVLoader._cachedir
+    CSVLoader._cachedir = previous
+
+def test_http_cache_revalidates(server, tmp_path):
+    url, path, statuses = server
+    cache = HTTPCache(str(tmp_path / 'cache'), timeout=5, retries=0)
+    body, meta = cache.fetch(url)
+    assert statuses == [ 200 ]
+    assert open(body).read() == path.read_text()
+
+    # An unchanged file is revalidated without a transfer
+    assert cache.fetch(url) == (body, meta)
+    assert statuses == [ 200, 304 ]
+
+    # A changed file is downloaded again
+    path.write_text('x1,y\n1,3\n')
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+    body, changed = cache.fetch(url)
+    assert statuses == [ 200, 304, 200 ]
+    assert changed['sha256'] != meta['sha256'] and open(body).read() == 'x1,y\n1,3\n'
+
+    # Offline mode serves the cached copy without requests
+    assert cache.fetch(url, offline=True) == (body, changed)
+    assert statuses == [ 200, 304, 200 ]
+
+def test_http_cache_serves_cached_copy_on_server_errors(server, tmp_path):
+    url, path, statuses = server
+    cache = HTTPCache(str(tmp_path / 'cache'), timeout=5, retries=1, backoff=0)
+    body, meta = cache.fetch(url)
+
+    # A failing server is treated like an unreachable one once the retries are exhausted
+    _Handler.error = 503
+    assert cache.fetch(url) == (body, meta)
+    assert statuses == [ 200, 503, 503 ]
+
+    # Without a cached copy the error is raised, and client errors are never retried
+    with pytest.raises(urllib.error.HTTPError):
+        HTTPCache(str(tmp_path / 'empty'), timeout=5, retries=0).fetch(url)
+    _Handler.error = 404
+    with pytest.raises(urllib.error.HTTPError):
+        cache.fetch(url)
+    assert statuses == [ 200, 503, 503, 503, 404 ]
+
+def test_scraper_uses_cache(server, cachedir):
+    url, _, statuses = server
+    loader = CSVScraper([ 'x1' ], [ 'y' ], url)
+    assert np.array_equal(loader.y, [ [ 2, 4, 6 ] ])
+    loader = CSVScraper([ 'x1' ], [ 'y' ], url, offline=True)
+    assert np.array_equal(loader.x, [ [ 1, 2, 3 ] ])
+    assert statuses == [ 200 ]
+
+@pytest.mark.parametrize('cachedir', [ None ], indirect=True)
+def test_scraper_without_cache(server, cachedir):
+    url, _, statuses = server
+    loader = CSVScraper([ 'x1' ], [ 'y' ], url)
+    assert np.array_equal(loader.y, [ [ 2, 4, 6 ] ])
+    assert statuses == [ 200 ]
+    with pytest.raises(Exception, match='offline'):
+        CSVScraper([ 'x1' ], [ 'y' ], url, offline=True)
+    assert statuses == [ 200 ]
+
+@pytest.mark.parametrize('cachedir', [ None ], indirect=True)
+def test_scraper_without_cache_retries(cachedir):
+    # Nothing listens on the port, so every attempt fails
+    previous = CSVScraper._retries
+    CSVScraper._retries = 0
+    try:
+        with pytest.raises(Exception, match='Failed to download'):
+            CSVScraper([ 'x1' ], [ 'y' ], 'http://127.0.0.1:9/data.csv')
+    finally:
+        CSVScraper._retries = previous
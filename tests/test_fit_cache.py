@@ -0,0 +1,51 @@
+##
+#  Tests of keys and entries of the fit cache
+#
+import numpy as np
+import pytest
+import scipy.sparse
+
+from loaders.CSVLoader import CSVLoader
+from loaders.CSVReader import CSVReader
+from models.FitCache import FitCache
+from models.GLMNormal import GLMNormal
+
+## Writes a CSV file into a temporary datasets folder and points the column cache at a temporary folder
+#  @return the filename of the dataset
+#
+@pytest.fixture
+def dataset(tmp_path):
+    folder, cachedir = CSVReader._foldername, CSVLoader._cachedir
+    (tmp_path / 'data.csv').write_text('x1,x2,y\n1,0.5,2\n2,1.5,4\n3,2.5,7\n4,3.5,9\n')
+    CSVReader._foldername, CSVLoader._cachedir = str(tmp_path), str(tmp_path / 'cache')
+    yield 'data.csv'
+    CSVReader._foldername, CSVLoader._cachedir = folder, cachedir
+
+def test_key_does_not_depend_on_column_cache(dataset):
+    config = { 'model': 'normal', 'intercept': True }
+    # The first load parses the file, the next ones map the column cache
+    keys = []
+    for _ in range(3):
+        loader = CSVReader([ 'x1', 'x2' ], [ 'y' ], dataset)
+        keys.append(FitCache.key([ loader.x, loader.y ], config))
+    assert keys[0] == keys[1] == keys[2]
+
+def test_key_distinguishes_layouts():
+    config = {}
+    csr = scipy.sparse.csr_matrix(np.arange(4.0).reshape(2, 2))
+    csc = scipy.sparse.csc_matrix(csr.toarray().T)
+    assert FitCache.key([ csr ], config) != FitCache.key([ csc ], config)
+    assert FitCache.key([ csr ], config) != FitCache.key([ csr.toarray() ], config)
+
+def test_put_then_get(tmp_path):
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(50), rng.normal(size=50) ])
+    y = (1 + 2 * x[1] + rng.normal(size=50))[None, :]
+    glm = GLMNormal(x, y, True)
+    glm.fit(method='irls')
+    cache = FitCache(str(tmp_path))
+    key = FitCache.key([ x, y ], { 'model': 'normal' })
+    assert cache.get(key) is None
+    cache.put(key, glm)
+    model, reference = cache.get(key)
+    assert np.array_equal(model.params, glm.params) and reference is None
@@ -0,0 +1,42 @@
+##
+#  Tests of GLMs with several responses fit at once
+#
+import numpy as np
+import pytest
+
+from models.GLMBernoulli import GLMBernoulli
+from models.GLMNormal import GLMNormal
+from models.GLMPoisson import GLMPoisson
+
+## Generates a design with an intercept and k responses of the given family
+#  @param model the GLM subclass
+#  @param k the number of responses
+#  @param n the number of observations
+#  @return tuple with [p, n] Xs and [k, n] Ys
+#
+def _data(model, k = 3, n = 150):
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(n), rng.normal(size=(2, n)) ])
+    eta = rng.normal(scale=0.5, size=(k, 3)) @ x
+    if (model is GLMNormal):
+        y = eta + rng.normal(size=eta.shape)
+    elif (model is GLMPoisson):
+        y = rng.poisson(np.exp(eta)).astype(float)
+    else:
+        y = (rng.random(eta.shape) < 1 / (1 + np.exp(-eta))).astype(float)
+    return x, y
+
+@pytest.mark.parametrize('model', [ GLMNormal, GLMPoisson, GLMBernoulli ])
+def test_neg_llik_matches_single_response_fits(model):
+    x, y = _data(model)
+    glm = model(x, y, False)
+    params = glm.fit(method='irls')
+    neg_llik, grad = glm._neg_llik_grad(params, x, y)
+    for j in range(y.shape[0]):
+        single = model(x, y[j:j + 1], False)
+        single_params = single.fit(method='irls')
+        single_neg_llik, single_grad = single._neg_llik_grad(single_params, x, y[j:j + 1])
+        assert np.allclose(params[:, j], single_params)
+        assert np.isclose(neg_llik[j], single_neg_llik, rtol=1e-12)
+        assert np.allclose(grad[:, j], single_grad)
+        assert np.isclose(glm.diagnostics['neg_llik'][j], single.diagnostics['neg_llik'], rtol=1e-12)
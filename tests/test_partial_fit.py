@@ -0,0 +1,85 @@
+##
+#  Tests of updating fitted models with partial_fit
+#
+import numpy as np
+import pytest
+
+from models.GLMNormal import GLMNormal
+from models.GLMPoisson import GLMPoisson
+
+## Generates a design with an intercept and Ys of a Normal GLM
+#  @param n the number of observations
+#  @param k the number of responses
+#  @return tuple with [p, n] Xs and [k, n] Ys
+#
+def _normal_data(n = 200, k = 1):
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(n), rng.normal(size=(2, n)) ])
+    y = np.array([ 1.0, -2.0, 0.5 ]) @ x + rng.normal(size=(k, n))
+    return x, y
+
+@pytest.mark.parametrize('fit', [ 'fit', 'fit_stream' ])
+def test_fit_then_partial_fit_equals_full_fit(fit):
+    x, y = _normal_data()
+    half = x.shape[1] // 2
+    full = GLMNormal(x, y, False)
+    full.fit(method='irls')
+
+    glm = GLMNormal(x[:, :half], y[:, :half], False)
+    if (fit == 'fit'):
+        glm.fit(method='irls')
+    else:
+        glm.fit_stream(lambda: iter([ (x[:, :half], y[:, :half]) ]))
+    glm.partial_fit(x[:, half:], y[:, half:])
+    assert np.allclose(glm.params, full.params, rtol=1e-10, atol=1e-12)
+    assert glm._n_seen == x.shape[1]
+
+def test_fit_then_partial_fit_multiple_responses():
+    x, y = _normal_data(k=3)
+    half = x.shape[1] // 2
+    full = GLMNormal(x, y, False)
+    full.fit(method='irls')
+    glm = GLMNormal(x[:, :half], y[:, :half], False)
+    glm.fit(method='irls')
+    glm.partial_fit(x[:, half:], y[:, half:])
+    assert np.allclose(glm.params, full.params, rtol=1e-10, atol=1e-12)
+
+def test_fit_then_partial_fit_approximates_poisson():
+    rng = np.random.default_rng(1)
+    x = np.vstack([ np.ones(2000), rng.normal(size=2000) ])
+    y = rng.poisson(np.exp(np.array([ 0.5, 0.3 ]) @ x))[None, :].astype(float)
+    full = GLMPoisson(x, y, False)
+    full.fit(method='irls')
+    glm = GLMPoisson(x[:, :1000], y[:, :1000], False)
+    glm.fit(method='irls')
+    glm.partial_fit(x[:, 1000:], y[:, 1000:])
+    assert np.allclose(glm.params, full.params, atol=1e-2)
+
+def test_partial_fit_after_regularized_fit_raises():
+    x, y = _normal_data()
+    glm = GLMNormal(x, y, False)
+    glm.fit_regularized(0.1)
+    with pytest.raises(Exception):
+        glm.partial_fit(x, y)
+
+def test_streamed_normal_keeps_scale():
+    x, y = _normal_data(k=2)
+    full = GLMNormal(x, y, False)
+    full.fit(method='irls')
+    glm = GLMNormal(None, None, False)
+    glm.fit_stream(lambda: ((x[:, i:i + 64], y[:, i:i + 64]) for i in range(0, x.shape[1], 64)))
+    assert np.allclose(glm.bse, full.bse, rtol=1e-9)
+    for key in ('deviance', 'null_deviance', 'scale', 'llf', 'llnull'):
+        assert np.allclose(glm._stats()[key], full._stats()[key], rtol=1e-9)
+
+def test_loaded_partial_fit_summary_has_standard_errors(capsys):
+    x, y = _normal_data()
+    full = GLMNormal(x, y, False)
+    full.fit(method='irls')
+    glm = GLMNormal(None, None, False)
+    for i in range(0, x.shape[1], 50):
+        glm.partial_fit(x[:, i:i + 50], y[:, i:i + 50])
+    loaded = GLMNormal.from_bytes(glm.to_bytes())
+    assert np.allclose(loaded.bse, full.bse)
+    loaded.summary()
+    assert 'std err' in capsys.readouterr().out
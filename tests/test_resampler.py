@@ -0,0 +1,44 @@
+##
+#  Tests of separation checks and of the replicates that Resampler keeps
+#
+import numpy as np
+import pytest
+import scipy.sparse
+
+from models.GLMBernoulli import GLMBernoulli
+from models.GLMPoisson import GLMPoisson
+from models.Resampler import Resampler
+
+## Generates a binary dataset with an intercept
+#  @param shift the offset of x1 between the classes. A large one separates them
+#  @return tuple with [2, n] Xs and [1, n] Ys
+#
+def _binary_data(shift, n = 60):
+    rng = np.random.default_rng(0)
+    y = (np.arange(n) % 2).astype(float)
+    x = np.vstack([ np.ones(n), rng.normal(size=n) + shift * y ])
+    return x, y[None, :]
+
+@pytest.mark.parametrize('sparse', [ False, True ])
+def test_separated(sparse):
+    overlap, separated = _binary_data(0.5), _binary_data(10)
+    # Quasi-complete separation: a binary predictor whose level 1 only has Ys of 1
+    quasi = (np.vstack([ overlap[0], (np.arange(60) % 4 == 1).astype(float) ]), overlap[1])
+    for (x, y), expected in ((overlap, False), (separated, True), (quasi, True)):
+        glm = GLMBernoulli(scipy.sparse.csc_matrix(x) if sparse else x, y, True)
+        glm.fit(method='irls')
+        assert glm.separated().tolist() == [ expected ]
+
+def test_bootstrap_drops_separated_replicates():
+    x, y = _binary_data(2, n=30)
+    result = Resampler(GLMBernoulli, x, y, True, workers=1).bootstrap(100, random_state=0)
+    assert result['n_failed'] > 0
+    # Kept replicates have finite MLEs, so their betas stay bounded
+    assert np.all(np.abs(result['replicates']) < 100)
+
+def test_other_families_are_never_separated():
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(50), rng.normal(size=50) ])
+    glm = GLMPoisson(x, rng.poisson(1.0, size=(2, 50)).astype(float), True)
+    glm.fit(method='irls')
+    assert glm.separated().tolist() == [ False, False ]
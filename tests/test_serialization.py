@@ -0,0 +1,57 @@
+##
+#  Tests of saved model artifacts
+#
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from models.GLMBase import GLMBase
+from models.GLMNormal import GLMNormal
+from models.GLMPoisson import GLMPoisson
+
+## Replaces the JSON header of an artifact
+#  @param data bytes with the artifact
+#  @param update a function that modifies the header dictionary in place
+#  @return bytes with the modified artifact
+#
+def _patch_header(data, update):
+    length = struct.unpack('<I', data[4:8])[0]
+    header = json.loads(data[8:8 + length])
+    update(header)
+    patched = json.dumps(header).encode()
+    return data[:4] + struct.pack('<I', len(patched)) + patched + data[8 + length:]
+
+@pytest.fixture
+def artifact():
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(100), rng.normal(size=100) ])
+    y = rng.poisson(np.exp(0.5 + 0.2 * x[1]))[None, :].astype(float)
+    glm = GLMPoisson(x, y, True)
+    glm.fit(method='irls')
+    return glm, glm.to_bytes()
+
+def test_round_trip(artifact):
+    glm, data = artifact
+    loaded = GLMBase.from_bytes(data)
+    assert type(loaded) is GLMPoisson
+    assert np.array_equal(loaded.params, glm.params) and np.allclose(loaded.bse, glm.bse)
+    with pytest.raises(Exception, match='is not a GLMNormal'):
+        GLMNormal.from_bytes(data)
+
+@pytest.mark.parametrize('update', [
+    lambda header: header.update(family='Popen', module='subprocess'),
+    lambda header: header.update(family='GLMBase'),
+])
+def test_unknown_family_is_rejected(artifact, update):
+    with pytest.raises(Exception, match='Unknown family'):
+        GLMBase.from_bytes(_patch_header(artifact[1], update))
+
+def test_unregistered_subclass_is_not_saved(artifact):
+    class GLMCustom(GLMPoisson):
+        pass
+    glm = GLMCustom(None, None, True)
+    glm._params, glm._fit = artifact[0].params, True
+    with pytest.raises(Exception, match='not a registered family'):
+        glm.to_bytes()
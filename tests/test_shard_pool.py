@@ -0,0 +1,48 @@
+##
+#  Tests of sharded fits and reuse of their worker pools
+#
+import numpy as np
+
+from models.GLMPoisson import GLMPoisson
+
+## Generates a Poisson dataset with an intercept
+#  @return tuple with [p, n] Xs and [1, n] Ys
+#
+def _data(n = 2000):
+    rng = np.random.default_rng(0)
+    x = np.vstack([ np.ones(n), rng.normal(size=(3, n)) ])
+    y = rng.poisson(np.exp(np.array([ 0.5, 0.2, -0.1, 0.3 ]) @ x))[None, :].astype(float)
+    return x, y
+
+def test_sharded_fits_reuse_the_pool():
+    x, y = _data()
+    serial = GLMPoisson(x, y, True)
+    serial.fit(method='irls')
+    glm = GLMPoisson(x, y, True)
+    try:
+        glm.fit(method='irls', workers=2)
+        pool = glm._shard_pool
+        assert np.allclose(glm.params, serial.params, rtol=1e-10)
+        glm.fit(method='BFGS', workers=2)
+        assert glm._shard_pool is pool
+        assert np.allclose(glm.params, serial.params, atol=1e-5)
+        # Other workers or data need a new pool, and the old one is released
+        glm.fit(method='irls', workers=3)
+        assert glm._shard_pool is not pool and len(pool._pools) == 0 and len(pool._blocks) == 0
+    finally:
+        glm.close()
+    assert glm._shard_pool is None
+
+def test_shards_are_pinned_to_workers():
+    x, y = _data()
+    glm = GLMPoisson(x, y, True)
+    try:
+        glm.fit(method='irls', workers=2)
+        pool = glm._shard_pool
+        assert len(pool._pools) == 2 and len(pool._shards) == 2
+        # Every worker has prepared only the shard it was given
+        code = "list(__import__('models.ShardPool', fromlist=[ '_models' ])._models)"
+        for executor, shard in zip(pool._pools, pool._shards):
+            assert executor.submit(eval, code).result() == [ shard['x'][0] ]
+    finally:
+        glm.close()
@@ -0,0 +1,51 @@
+##
+#  Tests that fits agree with the statsmodels reference used by testing_glm.py
+#
+import numpy as np
+import pytest
+
+sm = pytest.importorskip('statsmodels.api')
+
+from loaders.CSVReader import CSVReader
+from loaders.CSVStatsLoader import CSVStatsLoader
+from models.GLMBernoulli import GLMBernoulli
+from models.GLMNormal import GLMNormal
+from models.GLMPoisson import GLMPoisson
+
+## Loads the datasets of the comparisons with an intercept
+#  @return dictionary with spector and warpbreaks loaders
+#
+@pytest.fixture(scope='module')
+def datasets():
+    spector = CSVStatsLoader([ 'GPA', 'TUCE', 'PSI' ], [ 'GRADE' ], 'spector')
+    spector.add_constant()
+    warpbreaks = CSVReader([ 'wool', 'tension' ], [ 'breaks' ], 'warpbreaks.csv')
+    warpbreaks.add_constant()
+    return { 'spector': spector, 'warpbreaks': warpbreaks }
+
+_cases = [ (GLMNormal, 'Gaussian', 'spector'), (GLMBernoulli, 'Binomial', 'spector'), (GLMPoisson, 'Poisson', 'warpbreaks') ]
+
+@pytest.mark.parametrize('method', [ 'BFGS', 'Newton-CG', 'trust-ncg', 'irls' ])
+@pytest.mark.parametrize('model, family, dset', _cases)
+def test_default_tolerances_match_statsmodels(datasets, model, family, dset, method):
+    loader = datasets[dset]
+    glm = model(loader.x, loader.y, True)
+    glm.fit(method=method)
+    res = sm.GLM(loader.y.T, loader.x.T, family=getattr(sm.families, family)()).fit()
+    assert glm.diagnostics['converged'], glm.diagnostics['message']
+    assert np.allclose(glm.params, res.params, rtol=0, atol=1e-6)
+
+@pytest.mark.parametrize('const', [ False, True ])
+@pytest.mark.parametrize('model, family, dset', _cases)
+def test_fit_statistics_match_statsmodels(model, family, dset, const):
+    loader = CSVStatsLoader([ 'GPA', 'TUCE', 'PSI' ], [ 'GRADE' ], 'spector') if dset == 'spector' else \
+        CSVReader([ 'wool', 'tension' ], [ 'breaks' ], 'warpbreaks.csv')
+    if (const):
+        loader.add_constant()
+    glm = model(loader.x, loader.y, const)
+    glm.fit(method='irls')
+    res = sm.GLM(loader.y.T, loader.x.T, family=getattr(sm.families, family)()).fit()
+    stats = glm._stats()
+    assert np.allclose(glm.bse, res.bse, rtol=1e-4)
+    assert np.isclose(glm.llf, res.llf) and np.isclose(stats['llnull'], res.llnull)
+    assert np.isclose(1 - np.exp(2 * (stats['llnull'] - stats['llf']) / stats['nobs']), res.pseudo_rsquared())